@@ -0,0 +1,212 @@
+"""
+Бенчмарк горячих путей парсера на файлах из sheets/ (без сети и без БД).
+
+    python benchmark.py                      # таблица в консоль + bench_results.json
+    python benchmark.py --repeat 50 --output results/v1.json
+
+Для каждого замера: время (min/median/mean, мс) и аллокации (tracemalloc:
+пик и суммарный объем за один прогон). Результаты пишутся в JSON, чтобы
+сравнивать версии между релизами.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+# Бенчмарк работает только с локальным зеркалом и не трогает диск/БД бота
+os.environ.setdefault("BOT_TOKEN", "benchmark")
+os.environ.setdefault("DATABASE_URL", "postgresql://benchmark")
+os.environ["SCHEDULE_SOURCE"] = "local"
+os.environ["SCHEDULE_STORE_PATH"] = ""
+
+import schedule_parser as sp
+from schedule_cache import estimate_size
+from schedule_sources import LOCAL_SCHEDULE_FILES
+
+
+def _summary(timings: list, peak: int, current: int) -> dict:
+    return {
+        "repeat": len(timings),
+        "min_ms": round(min(timings), 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.mean(timings), 4),
+        "alloc_peak_kb": round(peak / 1024, 1),
+        "alloc_retained_kb": round(current / 1024, 1),
+    }
+
+
+def _measure(func, repeat: int) -> dict:
+    """Замеряет время func() repeat раз и аллокации одного отдельного прогона."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return _summary(timings, peak, current)
+
+
+async def _measure_async(coro_func, repeat: int) -> dict:
+    """
+    То же для корутины: все прогоны в уже запущенном цикле событий,
+    замеряется только await, без создания и закрытия цикла.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await coro_func()
+        timings.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    await coro_func()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return _summary(timings, peak, current)
+
+
+def _load_corpus() -> dict:
+    """Читает все файлы зеркала: url -> (содержимое, данные)."""
+    corpus = {}
+    for url, path in LOCAL_SCHEDULE_FILES.items():
+        with open(path, "rb") as f:
+            content = f.read()
+        corpus[url] = (content, sp.parse_schedule_content(content, path.lower().endswith(".xlsx")))
+    return corpus
+
+
+def _pick_sample(corpus: dict):
+    """Берет самый большой файл, его группы и даты для точечных замеров."""
+    url = max(corpus, key=lambda u: len(corpus[u][1]))
+    data = corpus[url][1]
+    schedule = sp.build_schedule(data)
+    return url, data, schedule, sorted(schedule.days), list(schedule.groups)
+
+
+def _reset_caches():
+    """Сбрасывает кэши расписаний до холодного состояния."""
+    sp.SCHEDULE_CACHE.clear()
+    sp.SCHEDULE_VALIDATORS.clear()
+    sp.TEACHER_INDEX.clear()
+    sp.TEACHER_INDEX_KEYS.clear()
+    sp._teacher_keys_sorted = None
+
+
+def run_benchmarks(repeat: int) -> dict:
+    corpus = _load_corpus()
+    url, data, schedule, dates, groups = _pick_sample(corpus)
+    sample_date = datetime.combine(dates[len(dates) // 2], datetime.min.time())
+    group = groups[0]
+    slot = schedule.find_group(group)
+    lessons = schedule.lessons_at(sample_date.date(), slot)
+    teacher = "Иванов"
+    findings = [
+        {"time": lesson.time, "group": posting_group, "details": lesson.lines, "is_even": False}
+        for posting_date, posting_group, lesson in sp.build_teacher_postings(schedule)
+        if posting_date == sample_date.date()
+    ]
+
+    results = {}
+
+    # --- Разбор файлов ---
+    results["parse_all_files"] = _measure(
+        lambda: [sp.parse_schedule_content(content, False) for content, _ in corpus.values()], repeat=max(1, repeat // 10)
+    )
+    results["parse_largest_file"] = _measure(lambda: sp.parse_schedule_content(corpus[url][0], False), repeat)
+    results["compile_largest_file"] = _measure(lambda: sp.compile_schedule(corpus[url][0], False, url), repeat)
+    results["schedule_size_kb"] = {
+        "raw_rows": round(estimate_size(data) / 1024, 1),
+        "schedule": round(estimate_size(schedule) / 1024, 1),
+    }
+
+    # --- Поиск по модели Schedule (тот же путь, что у day_selected) ---
+    results["schedule_find_group"] = _measure(lambda: [schedule.find_group(g) for g in groups], repeat)
+    results["schedule_lessons_at"] = _measure(lambda: schedule.lessons_at(sample_date.date(), slot), repeat)
+    results["schedule_lessons_for"] = _measure(lambda: schedule.lessons_for(sample_date.date(), group), repeat)
+
+    # --- Форматирование ---
+    results["format_schedule"] = _measure(lambda: sp.format_schedule(lessons, False, sample_date, group), repeat)
+    results["format_teacher_schedule"] = _measure(
+        lambda: sp.format_teacher_schedule(teacher, sample_date, findings), repeat
+    )
+
+    # --- Полный путь: холодный кэш (чтение + разбор всех файлов) и теплый ---
+    sp.shutdown_parse_executor()
+
+    def cold_teacher():
+        _reset_caches()
+        asyncio.run(sp.get_teacher_schedule(teacher, sample_date))
+
+    results["get_teacher_schedule_cold"] = _measure(cold_teacher, repeat=max(1, repeat // 10))
+    sp.shutdown_parse_executor()
+
+    async def warm_teacher():
+        await sp.get_teacher_schedule(teacher, sample_date)
+
+    async def warm_day():
+        await sp.get_day_schedule(*sp.URL_META[url][1:], group, "сегодня")
+
+    async def warm_paths():
+        await sp.fetch_schedules(sp.URL_META)
+        results["get_teacher_schedule_warm"] = await _measure_async(warm_teacher, repeat)
+        results["get_day_schedule_warm"] = await _measure_async(warm_day, repeat)
+
+    asyncio.run(warm_paths())
+    sp.shutdown_parse_executor()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "commit": _git_commit(),
+            "files": len(corpus),
+            "rows": sum(len(d) for _, d in corpus.values()),
+            "sample_file": LOCAL_SCHEDULE_FILES[url],
+        },
+        "results": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк парсера расписаний")
+    parser.add_argument("--repeat", type=int, default=20, help="число повторов каждого замера")
+    parser.add_argument("--output", default="bench_results.json", help="куда сохранить JSON")
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.repeat)
+
+    print(f"{'замер':<28}{'min, мс':>12}{'median, мс':>12}{'пик, КБ':>12}")
+    for name, stats in report["results"].items():
+        if "min_ms" not in stats:
+            print(f"{name:<28}" + ", ".join(f"{k}={v}" for k, v in stats.items()))
+            continue
+        print(f"{name:<28}{stats['min_ms']:>12.3f}{stats['median_ms']:>12.3f}{stats['alloc_peak_kb']:>12.1f}")
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"💾 Результаты сохранены в {args.output}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
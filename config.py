@@ -1,7 +1,12 @@
 import os
+import asyncio
+import hashlib
 import asyncpg
 from datetime import timezone, timedelta
 from dotenv import load_dotenv
+from user_cache import UserCache
+from db_repository import acquire, execute, executemany, fetch, fetchrow, cursor, get_pool_stats
+from metrics import register_cache, register_collector
 
 # Загружаем переменные из .env
 load_dotenv()
@@ -16,18 +21,145 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("❌ DATABASE_URL не найден! Укажи его в .env")
 
+# Как получать обновления: "polling" (getUpdates) или "webhook" (на тот же aiohttp-сервер)
+BOT_MODE = os.getenv("BOT_MODE", "polling").lower()
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL", os.getenv("RENDER_EXTERNAL_URL", ""))  # Публичный адрес сервиса
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+# Пусто — выводится из BOT_TOKEN: у всех воркеров один и тот же, и set_webhook одного не ломает остальных
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or hashlib.sha256(f"webhook:{BOT_TOKEN}".encode()).hexdigest()
+WEBHOOK_MAX_IN_FLIGHT = int(os.getenv("WEBHOOK_MAX_IN_FLIGHT", "64"))           # Одновременно обрабатываемых обновлений
+WEBHOOK_DRAIN_SECONDS = float(os.getenv("WEBHOOK_DRAIN_SECONDS", "20"))         # Сколько ждать их при остановке
+if BOT_MODE == "webhook" and not WEBHOOK_BASE_URL:
+    raise ValueError("❌ Для BOT_MODE=webhook укажи WEBHOOK_BASE_URL в .env")
+
+# Трассировка апдейтов: медленные пишутся в лог JSON-деревом участков
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "2"))
+TRACE_PROFILE_SAMPLE_RATE = float(os.getenv("TRACE_PROFILE_SAMPLE_RATE", "0"))  # Доля апдейтов под cProfile; 0 — выключено
+TRACE_PROFILE_DIR = os.getenv("TRACE_PROFILE_DIR", "profiles")                  # Куда сохранять профили медленных
+
 # Временная зона
 TZ = timezone(timedelta(hours=5))  # Екатеринбург UTC+5
 
 # ID группы для уведомлений
 GROUP_CHAT_ID = int(os.getenv("GROUP_CHAT_ID", "-4805485452"))
 
+# Загрузка файлов расписаний
+FETCH_CONCURRENCY = int(os.getenv("FETCH_CONCURRENCY", "8"))          # Всего одновременных загрузок
+FETCH_PER_HOST_LIMIT = int(os.getenv("FETCH_PER_HOST_LIMIT", "4"))    # Одновременно на один хост (bb.usurt.ru)
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "30"))  # Таймаут одного запроса
+FETCH_KEEPALIVE_SECONDS = float(os.getenv("FETCH_KEEPALIVE_SECONDS", "60"))  # Сколько держать соединение
+FETCH_DNS_CACHE_SECONDS = int(os.getenv("FETCH_DNS_CACHE_SECONDS", "600"))   # Кэш DNS
+
+# Откуда брать файлы расписаний: "http" (bb.usurt.ru), "local" (зеркало в папке sheets/)
+# или "auto" (сеть, а при ошибке — зеркало)
+SCHEDULE_SOURCE = os.getenv("SCHEDULE_SOURCE", "http").lower()
+SCHEDULE_LOCAL_DIR = os.getenv("SCHEDULE_LOCAL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "sheets"))
+
+# Фоновое обновление расписаний (до истечения кэша, с разбросом во времени)
+PREFETCH_CHECK_SECONDS = float(os.getenv("PREFETCH_CHECK_SECONDS", "60"))     # Как часто проверять кэш
+PREFETCH_MARGIN_SECONDS = float(os.getenv("PREFETCH_MARGIN_SECONDS", "600"))  # За сколько до истечения обновлять
+PREFETCH_JITTER_SECONDS = float(os.getenv("PREFETCH_JITTER_SECONDS", "300"))  # Разброс старта загрузок
+
+# Подготовка расписаний на сегодня/завтра для всех групп
+MATERIALIZE_AFTER_MIDNIGHT_SECONDS = float(os.getenv("MATERIALIZE_AFTER_MIDNIGHT_SECONDS", "60"))  # Запуск после полуночи по TZ
+MATERIALIZE_DEBOUNCE_SECONDS = float(os.getenv("MATERIALIZE_DEBOUNCE_SECONDS", "30"))  # Пауза, чтобы собрать пачку изменений файлов
+
+# Бюджет памяти под кэш расписаний вместе с индексом преподавателей (0 — без ограничения).
+# Вытесненные файлы поиск преподавателя читает из SCHEDULE_STORE_PATH, без него — качает заново
+SCHEDULE_CACHE_MAX_BYTES = int(os.getenv("SCHEDULE_CACHE_MAX_BYTES", str(128 * 1024 * 1024)))
+
+# Файл с разобранными расписаниями, чтобы после рестарта не начинать с пустого кэша
+# (пустая строка — не сохранять на диск)
+SCHEDULE_STORE_PATH = os.getenv("SCHEDULE_STORE_PATH", "schedule_cache.sqlite3")
+
+# Разбор XLS/XLSX вне event loop: "process" (несколько ядер) или "thread"
+PARSE_EXECUTOR = os.getenv("PARSE_EXECUTOR", "process").lower()
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+
+# Пул соединений с БД
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "5"))                    # Для бесплатного тарифа Render 5 соединений достаточно
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", "60"))             # Время на выполнение запроса
+DB_CONNECT_TIMEOUT = float(os.getenv("DB_CONNECT_TIMEOUT", "30"))             # 30 секунд хватит с головой
+DB_MAX_INACTIVE_LIFETIME = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", "300"))  # Закрывать простаивающие соединения
+# Кэш подготовленных выражений: 0 — для пулера Neon в режиме transaction (он их не поддерживает),
+# >0 — при прямом подключении или пулере в режиме session
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "0"))
+
+# Кэш пользователей в памяти
+USER_CACHE_CAPACITY = int(os.getenv("USER_CACHE_CAPACITY", "20000"))          # Сколько пользователей держать
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "0"))      # 0 — без устаревания
+USER_PRELOAD_LIMIT = int(os.getenv("USER_PRELOAD_LIMIT", "20000"))            # Сколько загрузить при старте
+USER_PRELOAD_PAGE_SIZE = int(os.getenv("USER_PRELOAD_PAGE_SIZE", "1000"))     # Размер страницы курсора
+
+# Сколько процессов бота обслуживают один BOT_TOKEN (несколько — только в режиме webhook)
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+
+# Хранилище состояний диалогов (FSM): "memory" — в процессе (по умолчанию),
+# "postgres" — переживает рестарт и общее для всех воркеров
+FSM_STORAGE = os.getenv("FSM_STORAGE", "memory").lower()
+FSM_CACHE_CAPACITY = int(os.getenv("FSM_CACHE_CAPACITY", "20000"))           # 0 — без локального кэша
+# Сколько верить локальной копии FSM (0 — бессрочно). Один воркер сам пишет все изменения,
+# и кэш не устаревает; при нескольких другой воркер мог уже сменить состояние
+FSM_CACHE_TTL_SECONDS = float(os.getenv("FSM_CACHE_TTL_SECONDS", "5" if BOT_WORKERS > 1 else "0"))
+if BOT_WORKERS > 1 and FSM_STORAGE != "postgres":
+    raise ValueError("❌ При BOT_WORKERS > 1 укажи FSM_STORAGE=postgres: состояния в памяти не видны другим воркерам")
+FSM_STATE_TTL_SECONDS = float(os.getenv("FSM_STATE_TTL_SECONDS", "604800"))  # Брошенные сценарии удаляются через неделю
+FSM_CLEANUP_SECONDS = float(os.getenv("FSM_CLEANUP_SECONDS", "3600"))        # Как часто чистить таблицу
+
+# Кэш проверки подписки на канал
+SUBSCRIPTION_CACHE_TTL_SECONDS = float(os.getenv("SUBSCRIPTION_CACHE_TTL_SECONDS", "600"))     # Подписан — не проверяем 10 минут
+SUBSCRIPTION_NEGATIVE_TTL_SECONDS = float(os.getenv("SUBSCRIPTION_NEGATIVE_TTL_SECONDS", "15"))  # Не подписан — перепроверяем быстро
+
+# Ежедневная рассылка расписания (по подписке пользователя)
+DAILY_PUSH_TIME = os.getenv("DAILY_PUSH_TIME", "07:00")                      # Время по TZ; пусто — рассылка выключена
+DAILY_PUSH_RATE = float(os.getenv("DAILY_PUSH_RATE", "25"))                  # Сообщений в секунду (лимит Telegram ~30)
+DAILY_PUSH_PAGE_SIZE = int(os.getenv("DAILY_PUSH_PAGE_SIZE", "500"))         # Получателей за один запрос к БД
+DAILY_PUSH_MAX_RETRIES = int(os.getenv("DAILY_PUSH_MAX_RETRIES", "3"))       # Повторы после retry_after
+
+# Отложенная запись пользователей в БД пачками
+USER_WRITE_FLUSH_SECONDS = float(os.getenv("USER_WRITE_FLUSH_SECONDS", "1"))  # Как часто сбрасывать очередь
+USER_WRITE_BATCH_SIZE = int(os.getenv("USER_WRITE_BATCH_SIZE", "500"))         # Максимум записей за один запрос
+USER_WRITE_MAX_RETRIES = int(os.getenv("USER_WRITE_MAX_RETRIES", "5"))         # Повторы при сбоях Neon
+
 # ГЛОБАЛЬНЫЙ ПУЛ СОЕДИНЕНИЙ
 db_pool = None
 
 # 🔥 КЭШ ПОЛЬЗОВАТЕЛЕЙ В ПАМЯТИ
 # Храним данные тут, чтобы бот работал мгновенно и не дергал базу лишний раз
-USER_CACHE = {}
+# (LRU с ограничением по размеру, прогревается при старте — см. preload_user_cache)
+USER_CACHE = UserCache(USER_CACHE_CAPACITY, USER_CACHE_TTL_SECONDS)
+register_cache("user", USER_CACHE)
+
+@register_collector
+def _collect_db_pool_metrics():
+    """Загрузка пула соединений и длина очереди записи для /metrics"""
+    stats = get_pool_stats(db_pool)
+    samples = [("user_write_queue", "gauge", "Изменения пользователей, ждущие записи в БД", (), {(): len(_PENDING_USER_WRITES)})]
+    if stats:
+        samples.append(("db_pool_connections", "gauge", "Соединения пула", ("state",), {
+            ("in_use",): stats["in_use"], ("idle",): stats["idle"], ("max",): stats["max_size"]
+        }))
+    return samples
+
+# 📝 ОЧЕРЕДЬ ЗАПИСИ В БД: user_id -> ("upsert", данные) или ("delete", None)
+# Повторные изменения одного пользователя схлопываются, в БД уходит только последнее
+_PENDING_USER_WRITES = {}
+# Пачка, которая прямо сейчас пишется в БД (нужна, чтобы не читать из БД устаревшее)
+_FLUSHING_USER_WRITES = {}
+_user_writes_ready = asyncio.Event()
+_user_writes_lock = asyncio.Lock()
+
+# Ошибки, после которых имеет смысл повторить запись (обрыв соединения, перегрузка Neon)
+_TRANSIENT_DB_ERRORS = (
+    asyncpg.PostgresConnectionError,
+    asyncpg.InterfaceError,
+    asyncpg.TooManyConnectionsError,
+    asyncpg.CannotConnectNowError,
+    ConnectionError,
+    OSError,
+    asyncio.TimeoutError,
+)
 
 async def init_db_pool():
     """Инициализация пула соединений при старте бота"""
@@ -39,12 +171,13 @@ async def init_db_pool():
             # Neon отлично работает со стандартным ssl='require'
             db_pool = await asyncpg.create_pool(
                 DATABASE_URL, 
-                min_size=1, 
-                max_size=5,              # Для бесплатного тарифа Render 5 соединений достаточно
-                command_timeout=60,      # Время на выполнение запроса
-                statement_cache_size=0,  # Для облачных баз лучше отключать кэш выражений
+                min_size=DB_POOL_MIN_SIZE, 
+                max_size=DB_POOL_MAX_SIZE,
+                command_timeout=DB_COMMAND_TIMEOUT,
+                statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+                max_inactive_connection_lifetime=DB_MAX_INACTIVE_LIFETIME,
                 ssl='require',           # Стандартный SSL для Neon
-                timeout=30               # 30 секунд хватит с головой
+                timeout=DB_CONNECT_TIMEOUT
             )
             print("✅ УСПЕХ! База Neon подключена")
         except Exception as e:
@@ -55,6 +188,7 @@ async def close_db_pool():
     """Закрытие пула при остановке"""
     global db_pool
     if db_pool:
+        await flush_user_writes()  # Дописываем всё, что осталось в очереди
         await db_pool.close()
         print("🛑 Пул соединений закрыт")
 
@@ -170,24 +304,129 @@ SCHEDULE_URLS = {
 async def create_tables():
     """Создает таблицы в базе данных если они не существуют"""
     try:
-        async with db_pool.acquire() as conn:
-            await conn.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id BIGINT PRIMARY KEY,
-                    faculty TEXT NOT NULL,
-                    course TEXT NOT NULL,
-                    group_name TEXT NOT NULL,
-                    username TEXT,
-                    full_name TEXT NOT NULL,
-                    registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+        async with acquire(db_pool) as conn:
+            await execute(conn, "create_users_table")
+            await execute(conn, "add_daily_push_column")
+            await execute(conn, "create_fsm_table")
+            await execute(conn, "create_fsm_updated_index")
             print("✅ Таблицы в базе данных созданы/проверены")
     except Exception as e:
         print(f"❌ Ошибка создания таблиц: {e}")
 
+def _queue_user_write(user_id, operation, user_info=None):
+    """Ставит изменение пользователя в очередь (перезаписывая предыдущее)"""
+    _PENDING_USER_WRITES.pop(user_id, None)
+    _PENDING_USER_WRITES[user_id] = (operation, user_info)
+    if len(_PENDING_USER_WRITES) >= USER_WRITE_BATCH_SIZE:
+        _user_writes_ready.set()
+
+def _get_pending_user_write(user_id):
+    """Последнее еще не записанное в БД изменение пользователя или None"""
+    return _PENDING_USER_WRITES.get(user_id) or _FLUSHING_USER_WRITES.get(user_id)
+
+def _user_row(user_id, info):
+    """Параметры запроса upsert_user"""
+    return (user_id, info['faculty'], info['course'], info['group'], info['username'], info['full_name'])
+
+async def _write_user_batch(batch):
+    """Пишет пачку изменений одной транзакцией"""
+    deletes = [user_id for user_id, (operation, _) in batch.items() if operation == "delete"]
+    upserts = [_user_row(user_id, info) for user_id, (operation, info) in batch.items() if operation == "upsert"]
+    async with acquire(db_pool) as conn:
+        async with conn.transaction():
+            if deletes:
+                await execute(conn, "delete_users", deletes)
+            if upserts:
+                await executemany(conn, "upsert_user", upserts)
+
+async def _write_user_rows(batch):
+    """
+    Пачка отвергнута базой (не сбой связи) — пишем по одной записи,
+    чтобы потерять только действительно плохие строки, а не всю пачку
+    """
+    dropped = 0
+    for user_id, write in batch.items():
+        try:
+            await _write_user_batch({user_id: write})
+        except _TRANSIENT_DB_ERRORS as e:
+            print(f"⚠️ Сбой записи пользователя {user_id} в БД, вернули в очередь: {e}")
+            _PENDING_USER_WRITES.setdefault(user_id, write)
+        except Exception as e:
+            print(f"❌ Запись пользователя {user_id} отброшена: {e}")
+            dropped += 1
+    if dropped:
+        print(f"❌ Из пачки {len(batch)} записей отброшено {dropped}")
+
+async def flush_user_writes():
+    """Сбрасывает очередь изменений пользователей в БД пачками с повторами при сбоях"""
+    async with _user_writes_lock:
+        while _PENDING_USER_WRITES and db_pool:
+            user_ids = list(_PENDING_USER_WRITES)[:USER_WRITE_BATCH_SIZE]
+            batch = {user_id: _PENDING_USER_WRITES.pop(user_id) for user_id in user_ids}
+            _FLUSHING_USER_WRITES.update(batch)
+            try:
+                for attempt in range(1, USER_WRITE_MAX_RETRIES + 1):
+                    try:
+                        await _write_user_batch(batch)
+                        break
+                    except _TRANSIENT_DB_ERRORS as e:
+                        print(f"⚠️ Сбой записи пользователей в БД (попытка {attempt}): {e}")
+                        await asyncio.sleep(min(0.5 * 2 ** attempt, 10))
+                    except Exception as e:
+                        print(f"❌ Ошибка записи пачки пользователей в БД, пишем по одной: {e}")
+                        await _write_user_rows(batch)
+                        break
+                else:
+                    # Не получилось — возвращаем в очередь то, что не успели перезаписать
+                    for user_id, write in batch.items():
+                        _PENDING_USER_WRITES.setdefault(user_id, write)
+                    return
+            except asyncio.CancelledError:
+                for user_id, write in batch.items():
+                    _PENDING_USER_WRITES.setdefault(user_id, write)
+                raise
+            finally:
+                _FLUSHING_USER_WRITES.clear()
+
+async def run_user_writer():
+    """Фоновая задача: периодически (или при наборе пачки) пишет очередь в БД"""
+    while True:
+        try:
+            await asyncio.wait_for(_user_writes_ready.wait(), timeout=USER_WRITE_FLUSH_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        _user_writes_ready.clear()
+        try:
+            await flush_user_writes()
+        except Exception as e:
+            print(f"❌ Ошибка фоновой записи пользователей: {e}")
+
+async def preload_user_cache():
+    """Прогревает USER_CACHE при старте: недавно зарегистрированные пользователи, курсором по страницам"""
+    limit = min(USER_PRELOAD_LIMIT, USER_CACHE_CAPACITY)
+    if limit <= 0:
+        return
+    loaded = 0
+    try:
+        async with acquire(db_pool) as conn:
+            async with conn.transaction():  # Курсоры в asyncpg работают только внутри транзакции
+                async for row in cursor(conn, "recent_users", limit, prefetch=USER_PRELOAD_PAGE_SIZE):
+                    data = {
+                        'faculty': row['faculty'],
+                        'course': row['course'],
+                        'group': row['group_name'],
+                        'username': row['username'],
+                        'full_name': row['full_name']
+                    }
+                    if not USER_CACHE.preload(row['user_id'], data):
+                        break
+                    loaded += 1
+        print(f"✅ Кэш пользователей прогрет: {loaded}")
+    except Exception as e:
+        print(f"❌ Ошибка прогрева кэша пользователей: {e}")
+
 async def update_user_data(user_id, user_info):
-    """Обновляет или создает данные пользователя (БД + КЭШ)"""
+    """Обновляет или создает данные пользователя (КЭШ сразу, БД — пачкой в фоне)"""
     
     # 1. Сначала обновляем кэш (это моментально)
     USER_CACHE[user_id] = {
@@ -198,55 +437,82 @@ async def update_user_data(user_id, user_info):
         'full_name': user_info['full_name']
     }
 
-    # 2. Потом обновляем базу данных
-    try:
-        async with db_pool.acquire() as conn:
-            await conn.execute('''
-                INSERT INTO users (user_id, faculty, course, group_name, username, full_name)
-                VALUES ($1, $2, $3, $4, $5, $6)
-                ON CONFLICT (user_id) 
-                DO UPDATE SET 
-                    faculty = $2,
-                    course = $3,
-                    group_name = $4,
-                    username = $5,
-                    full_name = $6,
-                    registered_at = CURRENT_TIMESTAMP
-            ''', user_id, user_info['faculty'], user_info['course'], 
-                user_info['group'], user_info['username'], user_info['full_name'])
-    except Exception as e:
-        print(f"❌ Ошибка обновления данных пользователя в БД: {e}")
+    # 2. Запись в БД уходит в очередь (см. run_user_writer)
+    _queue_user_write(user_id, "upsert", USER_CACHE[user_id])
 
 async def remove_user_data(user_id):
-    """Удаляет данные пользователя (БД + КЭШ)"""
+    """Удаляет данные пользователя (КЭШ сразу, БД — пачкой в фоне)"""
     
+    # Был ли пользователь зарегистрирован (кэш/очередь/БД)
+    existed = await get_user_data(user_id) is not None
+
     # 1. Удаляем из кэша
     if user_id in USER_CACHE:
         del USER_CACHE[user_id]
 
-    # 2. Удаляем из БД
+    # 2. Удаление из БД уходит в очередь
+    _queue_user_write(user_id, "delete")
+    return existed
+
+async def toggle_daily_push(user_id):
+    """Включает/выключает ежедневную рассылку. Возвращает новое значение или None, если пользователя нет"""
+    # Регистрация могла еще не дойти до БД — пишем только запись этого пользователя
+    # вместе с переключением; остальная очередь уходит в БД обычным порядком
+    pending = _get_pending_user_write(user_id)
+    if pending is not None and pending[0] == "delete":
+        return None
+    queued = _PENDING_USER_WRITES.pop(user_id, None)
     try:
-        async with db_pool.acquire() as conn:
-            result = await conn.execute('DELETE FROM users WHERE user_id = $1', user_id)
-            return "DELETE 1" in result
+        async with acquire(db_pool) as conn:
+            async with conn.transaction():
+                if pending is not None:
+                    # upsert_user не трогает daily_push, поэтому повтор той же записи из
+                    # сбрасываемой сейчас пачки переключение не откатит
+                    await executemany(conn, "upsert_user", [_user_row(user_id, pending[1])])
+                row = await fetchrow(conn, "toggle_daily_push", user_id)
+        return row['daily_push'] if row else None
     except Exception as e:
-        print(f"❌ Ошибка удаления пользователя из БД: {e}")
-        return False
+        if queued is not None:
+            _PENDING_USER_WRITES.setdefault(user_id, queued)
+        print(f"❌ Ошибка переключения рассылки: {e}")
+        return None
+
+async def get_daily_push_recipients(after, limit):
+    """
+    Следующая страница подписчиков рассылки, упорядоченная по (факультет, курс, группа).
+    after — ключ последней строки предыдущей страницы: (faculty, course, group_name, user_id)
+    """
+    async with acquire(db_pool) as conn:
+        return await fetch(conn, "daily_push_recipients", *after, limit)
+
+async def disable_daily_push(user_ids):
+    """Отключает рассылку пользователям, которым бот больше не может писать"""
+    if not user_ids:
+        return
+    try:
+        async with acquire(db_pool) as conn:
+            await execute(conn, "disable_daily_push", list(user_ids))
+    except Exception as e:
+        print(f"❌ Ошибка отключения рассылки: {e}")
 
 async def get_user_data(user_id):
     """Получает данные пользователя (Сначала КЭШ, потом БД)"""
     
     # 1. ПРОВЕРЯЕМ КЭШ
-    if user_id in USER_CACHE:
-        return USER_CACHE[user_id]
+    cached = USER_CACHE.get(user_id)
+    if cached is not None:
+        return cached
+
+    # 1.1 Изменение, которое еще не дошло до БД, важнее того, что в БД
+    pending = _get_pending_user_write(user_id)
+    if pending is not None:
+        operation, user_info = pending
+        return user_info if operation == "upsert" else None
 
     # 2. Если в кэше пусто, идем в базу
     try:
-        async with db_pool.acquire() as conn:
-            row = await conn.fetchrow(
-                'SELECT faculty, course, group_name, username, full_name FROM users WHERE user_id = $1', 
-                user_id
-            )
+        async with acquire(db_pool) as conn:
+            row = await fetchrow(conn, "get_user", user_id)
             if row:
                 data = {
                     'faculty': row['faculty'],
@@ -0,0 +1,148 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from aiogram import Bot
+from aiogram.enums import ParseMode
+from aiogram.exceptions import (
+    TelegramAPIError, TelegramRetryAfter, TelegramForbiddenError, TelegramNetworkError, TelegramServerError
+)
+
+from config import (
+    TZ, DAILY_PUSH_TIME, DAILY_PUSH_RATE, DAILY_PUSH_PAGE_SIZE, DAILY_PUSH_MAX_RETRIES,
+    get_daily_push_recipients, disable_daily_push
+)
+from schedule_parser import get_day_schedule
+
+
+class TokenBucket:
+    """Ограничитель скорости: не больше rate отправок в секунду, с паузой по retry_after"""
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Telegram попросил подождать — останавливаем все отправки"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _send(bot: Bot, bucket: TokenBucket, user_id: int, text: str, blocked: list) -> bool:
+    """
+    Отправляет одно сообщение с учетом лимита и retry_after.
+    Сетевые ошибки и 5xx повторяются, прочие ошибки API (чат не найден,
+    неверный запрос) — провал одного получателя, а не всей рассылки.
+    """
+    for attempt in range(DAILY_PUSH_MAX_RETRIES + 1):
+        await bucket.acquire()
+        try:
+            await bot.send_message(user_id, text, parse_mode=ParseMode.MARKDOWN_V2)
+            return True
+        except TelegramRetryAfter as e:
+            print(f"⏳ Telegram просит подождать {e.retry_after} с")
+            bucket.pause(e.retry_after)
+        except TelegramForbiddenError:
+            blocked.append(user_id)  # Бот заблокирован — больше не пишем
+            return False
+        except (TelegramNetworkError, TelegramServerError) as e:
+            print(f"⚠️ Рассылка пользователю {user_id}, попытка {attempt + 1}: {e}")
+            await asyncio.sleep(2 ** attempt)
+        except TelegramAPIError as e:
+            print(f"❌ Рассылка пользователю {user_id} не удалась: {e}")
+            return False
+    return False
+
+
+async def send_daily_schedules(bot: Bot, command: str = "сегодня") -> int:
+    """
+    Рассылает расписание всем подписчикам.
+    Подписчики идут страницами, отсортированными по группе, поэтому
+    текст каждой группы рендерится один раз на всех ее студентов.
+    """
+    bucket = TokenBucket(DAILY_PUSH_RATE)
+    after = ("", "", "", 0)
+    rendered = {}
+    sent, failed, blocked = 0, 0, []
+
+    try:
+        while True:
+            page = await get_daily_push_recipients(after, DAILY_PUSH_PAGE_SIZE)
+            if not page:
+                break
+            last = page[-1]
+            after = (last['faculty'], last['course'], last['group_name'], last['user_id'])
+
+            jobs = []
+            for row in page:
+                key = (row['faculty'], row['course'], row['group_name'])
+                if key not in rendered:
+                    try:
+                        rendered[key] = await get_day_schedule(row['faculty'], int(row['course']), row['group_name'], command)
+                    except Exception as e:
+                        print(f"❌ Не удалось подготовить расписание {key}: {e}")
+                        rendered[key] = None
+                if rendered[key]:
+                    jobs.append(_send(bot, bucket, row['user_id'], rendered[key], blocked))
+            # Непредвиденная ошибка одного получателя не должна обрывать страницу и рассылку
+            for result in await asyncio.gather(*jobs, return_exceptions=True):
+                if result is True:
+                    sent += 1
+                else:
+                    if isinstance(result, Exception):
+                        print(f"❌ Ошибка рассылки: {result!r}")
+                    failed += 1
+    finally:
+        # Даже при оборванной рассылке не пишем повторно заблокировавшим бота
+        await disable_daily_push(blocked)
+        print(f"📬 Ежедневная рассылка: отправлено {sent}, ошибок {failed - len(blocked)}, "
+              f"групп {len(rendered)}, заблокировали бота {len(blocked)}")
+    return sent
+
+
+def seconds_until_push(now: datetime = None) -> float:
+    """Сколько ждать до ближайшего DAILY_PUSH_TIME по TZ."""
+    now = now or datetime.now(TZ)
+    hours, minutes = map(int, DAILY_PUSH_TIME.split(":"))
+    push_at = now.replace(hour=hours, minute=minutes, second=0, microsecond=0)
+    if push_at <= now:
+        push_at += timedelta(days=1)
+    return (push_at - now).total_seconds()
+
+
+async def run_daily_push(bot: Bot):
+    """Фоновая задача: каждый день в DAILY_PUSH_TIME рассылает расписание на сегодня."""
+    if not DAILY_PUSH_TIME:
+        return
+    print(f"📬 Ежедневная рассылка расписания в {DAILY_PUSH_TIME}")
+    last_push_date = None
+    while True:
+        await asyncio.sleep(seconds_until_push())
+        today = datetime.now(TZ).date()
+        if today == last_push_date or today.weekday() == 6:
+            continue  # Уже разослали сегодня / по воскресеньям пар нет
+        last_push_date = today
+        try:
+            await send_daily_schedules(bot)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка ежедневной рассылки: {e}")
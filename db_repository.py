@@ -0,0 +1,146 @@
+from contextlib import asynccontextmanager
+
+from metrics import (
+    DB_ACQUIRE_SECONDS, DB_QUERY_SECONDS, DB_POOL_SATURATED, DB_QUERY_ERRORS, DB_CURSORS, observe_time
+)
+from tracing import span
+
+# ===== ИМЕНОВАННЫЕ ЗАПРОСЫ =====
+# Текст каждого запроса один и тот же, поэтому при statement_cache_size > 0
+# asyncpg готовит его на соединении один раз и дальше только передает параметры
+QUERIES = {
+    "create_users_table": '''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id BIGINT PRIMARY KEY,
+            faculty TEXT NOT NULL,
+            course TEXT NOT NULL,
+            group_name TEXT NOT NULL,
+            username TEXT,
+            full_name TEXT NOT NULL,
+            registered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    "add_daily_push_column": '''
+        ALTER TABLE users ADD COLUMN IF NOT EXISTS daily_push BOOLEAN NOT NULL DEFAULT FALSE
+    ''',
+    "create_fsm_table": '''
+        CREATE TABLE IF NOT EXISTS fsm_states (
+            key TEXT PRIMARY KEY,
+            state TEXT,
+            data JSONB NOT NULL DEFAULT '{}',
+            updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    "create_fsm_updated_index": '''
+        CREATE INDEX IF NOT EXISTS fsm_states_updated_at ON fsm_states (updated_at)
+    ''',
+    "fsm_get": '''
+        SELECT state, data FROM fsm_states WHERE key = $1
+    ''',
+    "fsm_set_state": '''
+        INSERT INTO fsm_states (key, state) VALUES ($1, $2)
+        ON CONFLICT (key) DO UPDATE SET state = $2, updated_at = CURRENT_TIMESTAMP
+    ''',
+    "fsm_set_data": '''
+        INSERT INTO fsm_states (key, data) VALUES ($1, $2::jsonb)
+        ON CONFLICT (key) DO UPDATE SET data = $2::jsonb, updated_at = CURRENT_TIMESTAMP
+    ''',
+    # Брошенные сценарии и пустые записи (после state.clear())
+    "fsm_delete_expired": '''
+        DELETE FROM fsm_states
+        WHERE updated_at < CURRENT_TIMESTAMP - make_interval(secs => $1)
+           OR (state IS NULL AND data = '{}'::jsonb)
+    ''',
+    "get_user": '''
+        SELECT faculty, course, group_name, username, full_name FROM users WHERE user_id = $1
+    ''',
+    "upsert_user": '''
+        INSERT INTO users (user_id, faculty, course, group_name, username, full_name)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        ON CONFLICT (user_id) 
+        DO UPDATE SET 
+            faculty = $2,
+            course = $3,
+            group_name = $4,
+            username = $5,
+            full_name = $6,
+            registered_at = CURRENT_TIMESTAMP
+    ''',
+    "delete_users": '''
+        DELETE FROM users WHERE user_id = ANY($1::bigint[])
+    ''',
+    "toggle_daily_push": '''
+        UPDATE users SET daily_push = NOT daily_push WHERE user_id = $1 RETURNING daily_push
+    ''',
+    "disable_daily_push": '''
+        UPDATE users SET daily_push = FALSE WHERE user_id = ANY($1::bigint[])
+    ''',
+    # Постраничный обход по ключу: без долгой транзакции и без OFFSET
+    "daily_push_recipients": '''
+        SELECT user_id, faculty, course, group_name FROM users
+        WHERE daily_push AND (faculty, course, group_name, user_id) > ($1, $2, $3, $4)
+        ORDER BY faculty, course, group_name, user_id LIMIT $5
+    ''',
+    "recent_users": '''
+        SELECT user_id, faculty, course, group_name, username, full_name FROM users
+        ORDER BY registered_at DESC LIMIT $1
+    ''',
+}
+
+@asynccontextmanager
+async def acquire(pool):
+    """Берет соединение из пула, замеряя ожидание и отмечая моменты, когда пул исчерпан"""
+    if pool.get_idle_size() == 0 and pool.get_size() >= pool.get_max_size():
+        DB_POOL_SATURATED.inc()
+    with observe_time(DB_ACQUIRE_SECONDS), span("db.acquire"):
+        conn = await pool.acquire()
+    try:
+        yield conn
+    finally:
+        await pool.release(conn)
+
+
+async def _run(name: str, call, *args):
+    """Выполняет запрос, замеряя его длительность и считая ошибки"""
+    try:
+        with observe_time(DB_QUERY_SECONDS, name), span("db", query=name):
+            return await call(QUERIES[name], *args)
+    except Exception:
+        DB_QUERY_ERRORS.inc(name)
+        raise
+
+
+async def execute(conn, name: str, *args):
+    return await _run(name, conn.execute, *args)
+
+
+async def executemany(conn, name: str, rows: list):
+    return await _run(name, conn.executemany, rows)
+
+
+async def fetch(conn, name: str, *args):
+    return await _run(name, conn.fetch, *args)
+
+
+async def fetchrow(conn, name: str, *args):
+    return await _run(name, conn.fetchrow, *args)
+
+
+def cursor(conn, name: str, *args, prefetch: int = None):
+    """Курсор по именованному запросу (только внутри транзакции)"""
+    DB_CURSORS.inc(name)
+    return conn.cursor(QUERIES[name], *args, prefetch=prefetch)
+
+
+def get_pool_stats(pool) -> dict:
+    """Текущая загрузка пула: размер, свободные, занятые соединения"""
+    if pool is None:
+        return {}
+    size, idle = pool.get_size(), pool.get_idle_size()
+    return {
+        "size": size,
+        "idle": idle,
+        "in_use": size - idle,
+        "min_size": pool.get_min_size(),
+        "max_size": pool.get_max_size(),
+    }
@@ -0,0 +1,104 @@
+import asyncio
+import json
+from typing import Any, Mapping
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+import config
+from config import FSM_CACHE_CAPACITY, FSM_CACHE_TTL_SECONDS, FSM_STATE_TTL_SECONDS, FSM_CLEANUP_SECONDS
+from db_repository import acquire, execute, fetchrow
+from user_cache import UserCache
+
+
+class PostgresStorage(BaseStorage):
+    """
+    FSM-хранилище в таблице fsm_states (общий db_pool), чтобы состояние
+    регистрации переживало рестарт и было видно всем воркерам.
+    Запись идет сразу в БД, чтение — через локальный кэш (state, data):
+    большинство апдейтов — нажатия без состояния, и их не нужно читать из БД.
+
+    С одним воркером (BOT_WORKERS=1) кэш бессрочный: все записи идут через него,
+    и состояние читается из БД только раз за жизнь процесса.
+
+    Ограничения при нескольких воркерах:
+    - кэш может отставать от БД на cache_ttl_seconds (FSM_CACHE_TTL_SECONDS);
+    - update_data — чтение-изменение-запись без блокировки: данные читаются
+      из БД мимо кэша, но если два воркера одновременно обновляют один ключ,
+      побеждает последняя запись, и ключи другого теряются;
+    - SimpleEventIsolation упорядочивает апдейты одного пользователя только
+      внутри процесса, поэтому апдейты на разных воркерах все равно гоняются.
+    """
+
+    def __init__(self, cache_capacity: int = FSM_CACHE_CAPACITY, cache_ttl_seconds: float = FSM_CACHE_TTL_SECONDS):
+        self.cache = UserCache(cache_capacity, cache_ttl_seconds)
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(
+            str(part) if part is not None else ""
+            for part in (key.bot_id, key.chat_id, key.user_id, key.thread_id, key.business_connection_id, key.destiny)
+        )
+
+    async def _load(self, key: str):
+        """(state, data) из кэша или из БД"""
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        async with acquire(config.db_pool) as conn:
+            row = await fetchrow(conn, "fsm_get", key)
+        cached = (row['state'], json.loads(row['data'])) if row else (None, {})
+        self.cache[key] = cached
+        return cached
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        key = self._key(key)
+        state = state.state if isinstance(state, State) else state
+        async with acquire(config.db_pool) as conn:
+            await execute(conn, "fsm_set_state", key, state)
+        if key in self.cache:
+            self.cache[key] = (state, self.cache[key][1])
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._load(self._key(key)))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        key = self._key(key)
+        data = dict(data)
+        async with acquire(config.db_pool) as conn:
+            await execute(conn, "fsm_set_data", key, json.dumps(data, ensure_ascii=False))
+        if key in self.cache:
+            self.cache[key] = (self.cache[key][0], data)
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._load(self._key(key)))[1])
+
+    async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> dict[str, Any]:
+        # Сливаем со свежей копией из БД, а не с кэшем, который мог устареть
+        cache_key = self._key(key)
+        if cache_key in self.cache:
+            del self.cache[cache_key]
+        return await super().update_data(key, data)
+
+    async def cleanup(self) -> int:
+        """Удаляет устаревшие и пустые записи, возвращает их число"""
+        async with acquire(config.db_pool) as conn:
+            status = await execute(conn, "fsm_delete_expired", FSM_STATE_TTL_SECONDS)
+        return int(status.split()[-1])
+
+    async def close(self) -> None:
+        pass  # Пулом владеет config (close_db_pool)
+
+
+async def run_fsm_cleanup(storage: PostgresStorage):
+    """Фоновая задача: периодически чистит таблицу fsm_states."""
+    while True:
+        try:
+            removed = await storage.cleanup()
+            if removed:
+                print(f"🧹 Удалено устаревших FSM-состояний: {removed}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка очистки FSM-состояний: {e}")
+        await asyncio.sleep(FSM_CLEANUP_SECONDS)
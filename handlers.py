@@ -4,9 +4,14 @@ from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.enums import ParseMode
 from datetime import datetime, timedelta
+import asyncio
+import time
 
 # ✅ ИЗМЕНЕНИЕ: Импортируем TZ, новые состояния и функции
-from config import FACULTIES, GROUP_CHAT_ID, update_user_data, remove_user_data, get_user_data, TZ
+from config import (
+    FACULTIES, GROUP_CHAT_ID, update_user_data, remove_user_data, get_user_data, TZ,
+    SUBSCRIPTION_CACHE_TTL_SECONDS, SUBSCRIPTION_NEGATIVE_TTL_SECONDS, DAILY_PUSH_TIME, toggle_daily_push
+)
 from states import Registration, TeacherSearch
 from schedule_parser import get_day_schedule, get_available_groups, get_teacher_schedule
 
@@ -14,6 +19,12 @@ router = Router()
 
 CHANNEL_USERNAME = "@smartschedule0"
 
+# Кэш проверок подписки: user_id -> (время истечения, подписан ли)
+SUBSCRIPTION_CACHE = {}
+SUBSCRIPTION_CACHE_MAX_SIZE = 50000
+# Идущие прямо сейчас запросы к Telegram: user_id -> задача (один запрос на пользователя)
+_INFLIGHT_SUBSCRIPTION_CHECKS = {}
+
 # --- Клавиатуры (без изменений) ---
 
 def get_subscription_keyboard():
@@ -63,20 +74,50 @@ def get_schedule_keyboard():
         one_time_keyboard=False
     )
 
-async def check_user_subscription(bot: Bot, user_id: int) -> bool:
-    """Проверяет, подписан ли пользователь на канал"""
+async def _fetch_user_subscription(bot: Bot, user_id: int) -> bool:
+    """Спрашивает Telegram, подписан ли пользователь, и кэширует ответ"""
     try:
         chat_member = await bot.get_chat_member(chat_id=CHANNEL_USERNAME, user_id=user_id)
-        return chat_member.status in ['member', 'administrator', 'creator']
     except Exception as e:
+        # Ошибки API не кэшируем, чтобы сбой Telegram не запирал пользователя
         print(f"Ошибка проверки подписки: {e}")
         return False
+    is_subscribed = chat_member.status in ['member', 'administrator', 'creator']
+    ttl = SUBSCRIPTION_CACHE_TTL_SECONDS if is_subscribed else SUBSCRIPTION_NEGATIVE_TTL_SECONDS
+    now = time.monotonic()
+    if len(SUBSCRIPTION_CACHE) >= SUBSCRIPTION_CACHE_MAX_SIZE:
+        # Чистим устаревшие записи, чтобы словарь не рос бесконечно
+        for key in [key for key, (expires_at, _) in SUBSCRIPTION_CACHE.items() if expires_at <= now]:
+            del SUBSCRIPTION_CACHE[key]
+    SUBSCRIPTION_CACHE[user_id] = (now + ttl, is_subscribed)
+    return is_subscribed
+
+async def check_user_subscription(bot: Bot, user_id: int) -> bool:
+    """Проверяет, подписан ли пользователь на канал (с кэшем и без дублей запросов)"""
+    cached = SUBSCRIPTION_CACHE.get(user_id)
+    if cached:
+        if cached[0] > time.monotonic():
+            return cached[1]
+        del SUBSCRIPTION_CACHE[user_id]
+
+    # Параллельные нажатия одного пользователя ждут один и тот же запрос
+    task = _INFLIGHT_SUBSCRIPTION_CHECKS.get(user_id)
+    if task is None:
+        task = asyncio.ensure_future(_fetch_user_subscription(bot, user_id))
+        _INFLIGHT_SUBSCRIPTION_CHECKS[user_id] = task
+        task.add_done_callback(lambda _: _INFLIGHT_SUBSCRIPTION_CHECKS.pop(user_id, None))
+    return await asyncio.shield(task)
+
+def invalidate_user_subscription(user_id: int):
+    """Забывает закэшированный результат проверки подписки"""
+    SUBSCRIPTION_CACHE.pop(user_id, None)
 
 # --- Основные хендлеры ---
 
 @router.callback_query(F.data == "check_subscription")
 async def check_subscription_callback(callback_query: types.CallbackQuery, bot: Bot):
     user_id = callback_query.from_user.id
+    invalidate_user_subscription(user_id)  # Пользователь говорит, что подписался, — проверяем заново
     if await check_user_subscription(bot, user_id):
         await callback_query.message.delete() # Удаляем сообщение с кнопками
         user_info = await get_user_data(user_id)
@@ -292,6 +333,21 @@ async def me_cmd(message: Message, bot: Bot):
         response = "Вы еще не зарегистрированы. Используйте /start для регистрации."
     await message.answer(response)
 
+@router.message(Command("push"))
+async def push_cmd(message: Message, bot: Bot):
+    """Включает/выключает ежедневную рассылку расписания"""
+    if not DAILY_PUSH_TIME:
+        await message.answer("Ежедневная рассылка сейчас недоступна.")
+        return
+    enabled = await toggle_daily_push(message.from_user.id)
+    if enabled is None:
+        response = "Вы еще не зарегистрированы. Используйте /start для регистрации."
+    elif enabled:
+        response = f"🔔 Рассылка включена: расписание на день будет приходить в {DAILY_PUSH_TIME}.\nОтключить — /push"
+    else:
+        response = "🔕 Рассылка отключена. Включить снова — /push"
+    await message.answer(response)
+
 
 # ===== НОВЫЕ ХЕНДЛЕРЫ ДЛЯ ПОИСКА ПРЕПОДАВАТЕЛЯ =====
 
@@ -1,8 +1,21 @@
 import asyncio
+import signal
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
-from config import BOT_TOKEN, create_tables, init_db_pool, close_db_pool
+from aiogram.fsm.storage.memory import MemoryStorage, SimpleEventIsolation
+from config import (
+    BOT_TOKEN, BOT_MODE, FSM_STORAGE, TRACE_SLOW_SECONDS, TRACE_PROFILE_SAMPLE_RATE, TRACE_PROFILE_DIR,
+    create_tables, init_db_pool, close_db_pool, run_user_writer, preload_user_cache
+)
 from handlers import router
+from schedule_fetcher import init_http_session, close_http_session
+from schedule_parser import shutdown_parse_executor, restore_schedule_cache
+from schedule_prefetcher import run_schedule_prefetcher
+from schedule_materializer import run_schedule_materializer
+from daily_push import run_daily_push
+from webhook import setup_webhook, run_webhook
+from fsm_storage import PostgresStorage, run_fsm_cleanup
+from metrics import handle_metrics, HandlerTimingMiddleware, TelegramTimingMiddleware
+from tracing import TracingMiddleware
 from aiohttp import web
 
 async def handle(request):
@@ -12,24 +25,80 @@ async def main():
     # 1. Сначала запускаем пул соединений
     await init_db_pool()
     
+    # 1.1 Общая HTTP-сессия для скачивания расписаний
+    await init_http_session()
+    
     # 2. Создаем таблицы
     await create_tables()
     
+    # 2.1 Прогреваем кэш пользователей одним проходом по таблице
+    await preload_user_cache()
+    
+    # 3. Поднимаем расписания, сохраненные до рестарта (до начала polling)
+    await restore_schedule_cache()
+    
     bot = Bot(token=BOT_TOKEN)
-    storage = MemoryStorage()
-    dp = Dispatcher(storage=storage)
+    bot.session.middleware(TelegramTimingMiddleware())  # Задержки Bot API в /metrics
+    # FSM_STORAGE=postgres: состояния регистрации в БД переживают рестарт и общие для всех воркеров
+    storage = PostgresStorage() if FSM_STORAGE == "postgres" else MemoryStorage()
+    # Апдейты одного пользователя — по очереди, чтобы update_data не терял ключи (в пределах процесса).
+    # FSM подключаем вручную после трассировки, иначе ожидание блокировки и get_state не попадут в трассу
+    dp = Dispatcher(storage=storage, events_isolation=SimpleEventIsolation(), disable_fsm=True)
     dp.include_router(router)
+    # Трасса каждого апдейта; медленные — в лог JSON (и в профиль, если включен)
+    dp.update.outer_middleware(TracingMiddleware(TRACE_SLOW_SECONDS, TRACE_PROFILE_SAMPLE_RATE, TRACE_PROFILE_DIR))
+    dp.update.outer_middleware(dp.fsm)
+    # Время каждого хендлера (day_selected, шаги регистрации, поиск преподавателя) в /metrics
+    router.message.middleware(HandlerTimingMiddleware())
+    router.callback_query.middleware(HandlerTimingMiddleware())
 
     # aiohttp сервер
     app = web.Application()
     app.router.add_get("/", handle)
+    app.router.add_get("/metrics", handle_metrics)
+    # В режиме webhook обновления приходят на этот же сервер
+    webhook = setup_webhook(dp, bot, app) if BOT_MODE == "webhook" else None
+    web_ready = asyncio.Event()
+
+    # Фоновое обновление кэша расписаний
+    prefetch_task = asyncio.create_task(run_schedule_prefetcher())
+    # Готовые расписания на сегодня/завтра (после полуночи и после смены файлов)
+    materialize_task = asyncio.create_task(run_schedule_materializer())
+    # Ежедневная рассылка расписания подписавшимся
+    push_task = asyncio.create_task(run_daily_push(bot))
+    # Фоновая запись регистраций в БД пачками
+    user_writer_task = asyncio.create_task(run_user_writer())
+    # Очистка брошенных FSM-состояний
+    fsm_cleanup_task = asyncio.create_task(run_fsm_cleanup(storage)) if isinstance(storage, PostgresStorage) else None
 
     # Запуск Telegram бота и веб-сервера параллельно
     async def run_bot():
         try:
-            await dp.start_polling(bot)
+            if webhook:
+                # SIGTERM от Render (и Ctrl+C) завершает вебхук штатно: дожидаемся обновлений,
+                # пишем очередь регистраций и закрываем пул. В polling это делает сам aiogram
+                stop = asyncio.Event()
+                loop = asyncio.get_running_loop()
+                for sig in (signal.SIGTERM, signal.SIGINT):
+                    try:
+                        loop.add_signal_handler(sig, stop.set)
+                    except NotImplementedError:
+                        pass  # Windows: остается KeyboardInterrupt
+                await web_ready.wait()  # Telegram начнет слать обновления сразу после set_webhook
+                await run_webhook(webhook, stop)
+            else:
+                await bot.delete_webhook()  # Иначе getUpdates не работает после режима webhook
+                await dp.start_polling(bot)
         finally:
-            await close_db_pool() # Закрываем базу при остановке бота
+            prefetch_task.cancel()
+            materialize_task.cancel()
+            push_task.cancel()
+            user_writer_task.cancel()
+            if fsm_cleanup_task:
+                fsm_cleanup_task.cancel()
+            await close_db_pool() # Закрываем базу при остановке бота (с записью очереди)
+            await close_http_session()
+            shutdown_parse_executor()
 
     async def run_web():
         runner = web.AppRunner(app)
@@ -37,6 +106,7 @@ async def main():
         site = web.TCPSite(runner, "0.0.0.0", 10000)
         await site.start()
         print("🌐 Web server запущен на порту 10000")
+        web_ready.set()
         # Веб-сервер будет работать вечно, пока не упадет
 
     await asyncio.gather(run_bot(), run_web())
@@ -0,0 +1,182 @@
+"""
+Метрики в текстовом формате Prometheus (/metrics) без внешних зависимостей.
+
+    SCHEDULE_FETCH_SECONDS.observe(0.42, url)          # наблюдение в гистограмму
+    with observe_time(SCHEDULE_PARSE_SECONDS, url): ... # замер блока кода
+    register_cache("schedule", SCHEDULE_CACHE)          # hits/misses/ratio из cache.stats()
+"""
+import time
+from contextlib import contextmanager
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiohttp import web
+
+from tracing import span
+
+# Границы корзин в секундах: от быстрых обращений к кэшу до скачивания файла
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_METRICS = []     # Гистограммы и счетчики в порядке объявления
+_COLLECTORS = []  # Функции, которые при опросе возвращают [(имя, тип, описание, имена меток, {метки: значение})]
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class Histogram:
+    """Гистограмма с метками: для каждого набора меток — счетчики корзин, сумма и количество"""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = buckets
+        self._series = {}  # метки -> [счетчики корзин, сумма, количество]
+        _METRICS.append(self)
+
+    def observe(self, value: float, *labels):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[0][i] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for labels, (counts, total, count) in self._series.items():
+            for bound, bucket_count in zip(self.buckets, counts):
+                bucket_labels = _format_labels(self.labelnames + ("le",), labels + (bound,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames + ('le',), labels + ('+Inf',))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {count}")
+        return lines
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+
+    def __init__(self, name: str, description: str, labelnames: tuple = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._values = {}
+        _METRICS.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {value}")
+        return lines
+
+
+@contextmanager
+def observe_time(histogram: Histogram, *labels):
+    """Замеряет длительность блока и пишет ее в гистограмму"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, *labels)
+
+
+def register_collector(func):
+    """Добавляет функцию, значения которой считываются в момент опроса /metrics"""
+    _COLLECTORS.append(func)
+    return func
+
+
+def register_cache(name: str, cache):
+    """Экспортирует cache.stats(): записи, попадания, промахи, вытеснения и долю попаданий"""
+    def collect():
+        stats = cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        return [
+            ("cache_entries", "gauge", "Записей в кэше", ("cache",), {(name,): stats["entries"]}),
+            ("cache_hits_total", "counter", "Попадания в кэш", ("cache",), {(name,): stats["hits"]}),
+            ("cache_misses_total", "counter", "Промахи кэша", ("cache",), {(name,): stats["misses"]}),
+            ("cache_evictions_total", "counter", "Вытеснения из кэша", ("cache",), {(name,): stats["evictions"]}),
+            ("cache_hit_ratio", "gauge", "Доля попаданий", ("cache",), {(name,): stats["hits"] / lookups if lookups else 0}),
+        ] + ([("cache_bytes", "gauge", "Примерный объем кэша в байтах", ("cache",), {(name,): stats["bytes"]})]
+             if "bytes" in stats else [])
+    _COLLECTORS.append(collect)
+
+
+def render_metrics() -> str:
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+
+    # Собранные при опросе значения объединяем по имени метрики (у разных кэшей имена общие)
+    collected = {}
+    for collect in _COLLECTORS:
+        try:
+            samples = collect()
+        except Exception as e:
+            print(f"❌ Ошибка сбора метрик: {e}")
+            continue
+        for name, kind, description, labelnames, values in samples:
+            entry = collected.setdefault(name, (kind, description, labelnames, []))
+            entry[3].extend(values.items())
+    for name, (kind, description, labelnames, values) in collected.items():
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in values:
+            lines.append(f"{name}{_format_labels(labelnames, labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+async def handle_metrics(request):
+    return web.Response(text=render_metrics(), content_type="text/plain")
+
+
+# ===== МЕТРИКИ ГОРЯЧИХ ПУТЕЙ =====
+HANDLER_SECONDS = Histogram("bot_handler_duration_seconds", "Время обработки апдейта хендлером", ("handler",))
+HANDLER_ERRORS = Counter("bot_handler_errors_total", "Исключения в хендлерах", ("handler",))
+TELEGRAM_API_SECONDS = Histogram("telegram_api_duration_seconds", "Длительность запросов к Bot API", ("method",))
+SCHEDULE_FETCH_SECONDS = Histogram("schedule_fetch_duration_seconds", "Загрузка файла расписания", ("url",))
+SCHEDULE_PARSE_SECONDS = Histogram("schedule_parse_duration_seconds", "Разбор файла расписания", ("url",))
+DB_ACQUIRE_SECONDS = Histogram("db_pool_acquire_seconds", "Ожидание соединения из пула")
+DB_QUERY_SECONDS = Histogram("db_query_duration_seconds", "Длительность именованных запросов", ("query",))
+DB_POOL_SATURATED = Counter("db_pool_saturated_total", "Запросы соединения при исчерпанном пуле")
+DB_QUERY_ERRORS = Counter("db_query_errors_total", "Ошибки именованных запросов", ("query",))
+DB_CURSORS = Counter("db_cursors_total", "Открытые курсоры по именованным запросам", ("query",))
+
+
+class HandlerTimingMiddleware(BaseMiddleware):
+    """Замеряет время каждого хендлера роутера (метка — имя функции хендлера) и отмечает его в трассе"""
+
+    async def __call__(self, handler, event, data):
+        name = data["handler"].callback.__name__
+        start = time.perf_counter()
+        try:
+            with span("handler", handler=name):
+                return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(name)
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - start, name)
+
+
+class TelegramTimingMiddleware(BaseRequestMiddleware):
+    """Замеряет каждый вызов Bot API (метка — метод, например SendMessage) и отмечает его в трассе"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+        with observe_time(TELEGRAM_API_SECONDS, name), span("telegram", method=name):
+            return await make_request(bot, method)
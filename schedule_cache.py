@@ -0,0 +1,119 @@
+import sys
+from collections import OrderedDict
+
+
+def estimate_size(obj) -> int:
+    """
+    Примерный объем объекта в памяти (байты) с учетом вложенных списков,
+    кортежей, словарей, строк и объектов со __slots__. Общие объекты
+    (интернированные строки, одинаковые пары) считаются один раз.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        else:
+            for slot in getattr(type(item), "__slots__", ()):
+                if hasattr(item, slot):
+                    stack.append(getattr(item, slot))
+    return total
+
+
+class ScheduleCache:
+    """
+    LRU-кэш расписаний url -> (время загрузки, Schedule, записи индекса преподавателей)
+    с бюджетом по памяти. Размер записи считается вместе с записями индекса,
+    которые при вытеснении тоже удаляются (on_evict), — освобождается все посчитанное.
+    get() — обращение пользователя (статистика + LRU), [] и peek() — просто чтение.
+    on_evict(url) вызывается после вытеснения записи (не при замене).
+    """
+
+    def __init__(self, max_bytes: int, on_evict=None):
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, url):
+        return url in self._entries
+
+    def __getitem__(self, url):
+        return self._entries[url]
+
+    def __iter__(self):
+        return iter(self._entries)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def peek(self, url):
+        return self._entries.get(url)
+
+    def get(self, url):
+        entry = self._entries.get(url)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(url)
+        return entry
+
+    def __setitem__(self, url, entry):
+        old = self._entries.get(url)
+        if old is not None and old[1] is entry[1]:
+            # Продление жизни той же записи — размер не пересчитываем
+            size = self._sizes[url]
+        else:
+            size = estimate_size(entry)
+        self._remove(url)
+        self._entries[url] = entry
+        self._sizes[url] = size
+        self.bytes += size
+        self._evict()
+
+    def _remove(self, url):
+        if url in self._entries:
+            del self._entries[url]
+            self.bytes -= self._sizes.pop(url)
+
+    def _evict(self):
+        """Выкидывает самые давно использованные записи, пока не влезем в бюджет."""
+        while self.max_bytes and self.bytes > self.max_bytes and len(self._entries) > 1:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+            if self.on_evict:
+                self.on_evict(oldest)
+            print(f"🧹 Расписание {oldest} вытеснено из кэша")
+
+    def is_full(self) -> bool:
+        return bool(self.max_bytes) and self.bytes >= self.max_bytes
+
+    def clear(self):
+        self._entries.clear()
+        self._sizes.clear()
+        self.bytes = 0
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
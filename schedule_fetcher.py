@@ -0,0 +1,77 @@
+import asyncio
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from config import (
+    FETCH_CONCURRENCY, FETCH_PER_HOST_LIMIT, FETCH_TIMEOUT_SECONDS,
+    FETCH_KEEPALIVE_SECONDS, FETCH_DNS_CACHE_SECONDS
+)
+
+# Общий лимит одновременных загрузок и отдельный лимит на каждый хост,
+# чтобы при холодном кэше не открывать десятки запросов к bb.usurt.ru разом
+_GLOBAL_LIMIT = asyncio.Semaphore(FETCH_CONCURRENCY)
+_HOST_LIMITS = {}
+
+# ОБЩАЯ HTTP-СЕССИЯ (живет столько же, сколько бот, открывается в main.py)
+http_session = None
+
+
+async def init_http_session():
+    """Создает общую сессию с пулом keep-alive соединений"""
+    global http_session
+    if http_session is None or http_session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=FETCH_CONCURRENCY,
+            limit_per_host=FETCH_PER_HOST_LIMIT,
+            keepalive_timeout=FETCH_KEEPALIVE_SECONDS,  # Держим соединения теплыми между загрузками
+            ttl_dns_cache=FETCH_DNS_CACHE_SECONDS       # Не резолвим bb.usurt.ru на каждый файл
+        )
+        http_session = aiohttp.ClientSession(connector=connector)
+
+
+async def close_http_session():
+    """Закрытие HTTP-сессии при остановке"""
+    global http_session
+    if http_session and not http_session.closed:
+        await http_session.close()
+        print("🛑 HTTP-сессия закрыта")
+    http_session = None
+
+
+def _get_host_limit(url: str) -> asyncio.Semaphore:
+    """Возвращает семафор для хоста из URL."""
+    host = urlsplit(url).netloc
+    if host not in _HOST_LIMITS:
+        _HOST_LIMITS[host] = asyncio.Semaphore(FETCH_PER_HOST_LIMIT)
+    return _HOST_LIMITS[host]
+
+
+async def fetch_url(url: str, etag: str = None, last_modified: str = None):
+    """
+    Скачивает файл с учетом лимитов и таймаута.
+    Если переданы etag/last_modified — отправляет условный запрос.
+    Возвращает {status, content, etag, last_modified} (status 200 или 304) либо None.
+    """
+    if http_session is None or http_session.closed:
+        # Например, при запуске парсера вне main.py
+        await init_http_session()
+
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+
+    async with _GLOBAL_LIMIT, _get_host_limit(url):
+        timeout = aiohttp.ClientTimeout(total=FETCH_TIMEOUT_SECONDS)
+        async with http_session.get(url, headers=headers, timeout=timeout) as response:
+            if response.status not in (200, 304):
+                print(f"❌ Ошибка загрузки {url}: статус {response.status}")
+                return None
+            return {
+                "status": response.status,
+                "content": await response.read() if response.status == 200 else None,
+                "etag": response.headers.get("ETag", etag),
+                "last_modified": response.headers.get("Last-Modified", last_modified)
+            }
@@ -0,0 +1,71 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from config import TZ, SCHEDULE_URLS, MATERIALIZE_AFTER_MIDNIGHT_SECONDS, MATERIALIZE_DEBOUNCE_SECONDS
+from schedule_parser import SCHEDULE_CHANGED, get_available_groups, get_day_schedule
+
+# Команды, ради которых заранее готовим тексты (основная часть запросов)
+MATERIALIZED_COMMANDS = ("сегодня", "завтра")
+
+
+def iter_faculty_courses():
+    """Все пары (факультет, курс), у которых есть файлы хотя бы на одну неделю."""
+    seen = set()
+    for faculties in SCHEDULE_URLS.values():
+        for faculty, courses in faculties.items():
+            for course in courses:
+                if (faculty, course) not in seen:
+                    seen.add((faculty, course))
+                    yield faculty, course
+
+
+async def materialize_day_schedules() -> int:
+    """
+    Рендерит расписание на сегодня и завтра для каждой известной группы.
+    Тексты оседают в RENDERED_SCHEDULES, и «Сегодня»/«Завтра» отдаются без разбора.
+    """
+    rendered = 0
+    for faculty, course in iter_faculty_courses():
+        try:
+            groups = await get_available_groups(faculty, course)
+            for group in groups:
+                for command in MATERIALIZED_COMMANDS:
+                    await get_day_schedule(faculty, course, group, command)
+                    rendered += 1
+                await asyncio.sleep(0)  # Не держим event loop на сотнях групп подряд
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка подготовки расписаний {faculty}, {course} курс: {e}")
+    return rendered
+
+
+def seconds_until_rollover(now: datetime = None) -> float:
+    """Сколько ждать до следующего запуска: полночь по TZ плюс небольшой запас."""
+    now = now or datetime.now(TZ)
+    midnight = datetime.combine(now.date() + timedelta(days=1), datetime.min.time(), tzinfo=TZ)
+    return (midnight - now).total_seconds() + MATERIALIZE_AFTER_MIDNIGHT_SECONDS
+
+
+async def run_schedule_materializer():
+    """
+    Фоновая задача: готовит расписания на сегодня/завтра при старте,
+    сразу после полуночи и после каждого изменения файлов расписаний.
+    """
+    print("🗓 Подготовка расписаний на сегодня/завтра запущена")
+    while True:
+        try:
+            rendered = await materialize_day_schedules()
+            print(f"🗓 Подготовлено расписаний: {rendered}")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка подготовки расписаний: {e}")
+
+        try:
+            await asyncio.wait_for(SCHEDULE_CHANGED.wait(), timeout=seconds_until_rollover())
+            # Файлы обычно обновляются пачкой — ждем, пока докачаются остальные
+            await asyncio.sleep(MATERIALIZE_DEBOUNCE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+        SCHEDULE_CHANGED.clear()
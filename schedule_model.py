@@ -0,0 +1,56 @@
+class Lesson:
+    """
+    Одна пара: время и строки описания (предмет, преподаватель, аудитория).
+    Одинаковые ячейки в одно время хранятся одним объектом на весь файл.
+    """
+    __slots__ = ("time", "lines")
+
+    def __init__(self, time: str, lines: tuple):
+        self.time = time
+        self.lines = lines
+
+    def text(self) -> str:
+        """Текст пары для поиска преподавателя (строки ячейки без маркеров '-')."""
+        return "\n".join(self.lines)
+
+    def __repr__(self):
+        return f"Lesson({self.time!r}, {self.lines!r})"
+
+
+class Schedule:
+    """
+    Разобранный файл расписания.
+    groups — группы из заголовка в порядке столбцов, group_slots — группа -> номер слота,
+    days — дата -> кортеж по слотам групп из кортежей Lesson.
+    """
+    __slots__ = ("groups", "group_slots", "days")
+
+    def __init__(self, groups: tuple, days: dict):
+        self.groups = groups
+        self.group_slots = {group: slot for slot, group in enumerate(groups)}
+        self.days = days
+
+    def __bool__(self):
+        return bool(self.groups)
+
+    def find_group(self, group_name: str) -> int:
+        """Номер слота группы или -1."""
+        return self.group_slots.get(group_name, -1)
+
+    def lessons_at(self, search_date, slot: int):
+        """Пары слота на дату в виде [(время, строки)] или None, если даты нет в файле."""
+        day = self.days.get(search_date)
+        if day is None or slot < 0:
+            return None
+        return [(lesson.time, list(lesson.lines)) for lesson in day[slot]]
+
+    def lessons_for(self, search_date, group_name: str):
+        """Пары группы на дату или None, если группы или даты нет в файле."""
+        return self.lessons_at(search_date, self.find_group(group_name))
+
+    def iter_lessons(self):
+        """Все пары файла: (дата, группа, Lesson)."""
+        for search_date, day in self.days.items():
+            for group, lessons in zip(self.groups, day):
+                for lesson in lessons:
+                    yield search_date, group, lesson
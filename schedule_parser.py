@@ -1,18 +1,63 @@
+import asyncio
+import hashlib
 import io
+import multiprocessing
 import re
+import sys
 import time
+from bisect import bisect_left
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime, timedelta
+from functools import lru_cache
 
-import aiohttp
 import openpyxl
 import xlrd
 
-from config import SCHEDULE_URLS, TZ, FACULTIES
+from config import SCHEDULE_URLS, TZ, FACULTIES, PARSE_EXECUTOR, PARSE_WORKERS, SCHEDULE_CACHE_MAX_BYTES
+from metrics import SCHEDULE_FETCH_SECONDS, SCHEDULE_PARSE_SECONDS, observe_time, register_cache, register_collector
+from schedule_cache import ScheduleCache
+from tracing import span
+from schedule_model import Lesson, Schedule
+from schedule_sources import fetch_schedule_file
+from schedule_store import save_schedule_entry, load_schedule_entries, load_schedule_entry
 
 # ===== ПЕРЕМЕННЫЕ ДЛЯ КЭШИРОВАНИЯ =====
-SCHEDULE_CACHE = {} 
+# url -> (время загрузки, Schedule, записи файла в TEACHER_INDEX по ключам);
+# при вытеснении записи файла уходят и из индекса (см. _drop_teacher_index ниже)
+SCHEDULE_CACHE = ScheduleCache(SCHEDULE_CACHE_MAX_BYTES, on_evict=lambda url: _drop_teacher_index(url))
+register_cache("schedule", SCHEDULE_CACHE)
+# url -> {etag, last_modified, hash} последней разобранной версии файла
+# Переживает вытеснение из SCHEDULE_CACHE: вытесненный файл перепроверяется, а не качается заново
+SCHEDULE_VALIDATORS = {}
+# url -> когда файл последний раз скачан или подтвержден (в т.ч. вытесненный из кэша)
+SCHEDULE_CHECKED_AT = {}
+# url -> задача загрузки, которая уже выполняется (одна загрузка на всех ждущих)
+_INFLIGHT_LOADS = {}
+
+# Готовые тексты расписаний: url -> {(группа, дата): текст}; сбрасывается при смене файла
+RENDERED_SCHEDULES = {}
+# Каталог источников: url -> (группы для выбора, все группы файла, даты файла).
+# Маленький и не вытесняется вместе с SCHEDULE_CACHE, поэтому по нему сразу
+# видно, в каком файле искать группу на дату, и список групп без скачивания
+SCHEDULE_CATALOG = {}
+# Взводится, когда уже закэшированный файл поменялся (для пересборки готовых расписаний)
+SCHEDULE_CHANGED = asyncio.Event()
+
+# Пул для разбора XLS вне event loop (создается при первой загрузке)
+_parse_executor = None
+
 CACHE_DURATION_SECONDS = 3600  # 1 час
 
+# Индекс преподавателей: «фамилия и о» -> {url: [(дата, группа, Lesson)]}.
+# Содержит ровно файлы из SCHEDULE_CACHE: их записи входят в бюджет кэша.
+# Вытесненные файлы поиск преподавателя читает с диска, не возвращая в кэш
+TEACHER_INDEX = {}
+# url -> ключи, под которыми лежат записи этого файла (для инкрементальной пересборки)
+TEACHER_INDEX_KEYS = {}
+# Ключи TEACHER_INDEX по алфавиту для поиска по префиксу (None — пересобрать)
+_teacher_keys_sorted = None
+
 # --- Константы ---
 RUS_DAYS_SHORT = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
 RUS_MONTHS = {
@@ -30,77 +75,554 @@ def escape_markdown(text: str) -> str:
     return re.sub(f'([{re.escape(escape_chars)}])', r'\\\1', str(text))
 
 
-def parse_russian_date(date_str: str):
+_DATE_PATTERNS = [
+    re.compile(r'(\d{1,2})\s+(\w+)\s+(\w+)'), re.compile(r'(\d{1,2})\s+(\w+)'), re.compile(r'"(\d{1,2})\s+(\w+)\s+(\w+)"')
+]
+
+
+@lru_cache(maxsize=4096)
+def _parse_day_month(date_str: str):
+    """Достает (день, месяц) из строки '8 декабря'. Не зависит от текущей даты, поэтому кэшируется."""
+    date_str = date_str.lower().strip()
+    for pattern in _DATE_PATTERNS:
+        match = pattern.search(date_str)
+        if match:
+            groups = match.groups()
+            if len(groups) >= 2:
+                day = int(groups[0])
+                month_str = groups[1].strip()
+                month = next((num for rus_month, num in RUS_MONTHS_REVERSE.items() if rus_month in month_str), None)
+                if month:
+                    return day, month
+    return None
+
+
+def _resolve_year(day: int, month: int, reference: datetime):
+    """Подставляет год: даты раньше reference относятся к следующему году."""
+    year = reference.year
+    if month < reference.month or (month == reference.month and day < reference.day):
+        year += 1
+    try:
+        return datetime(year, month, day)
+    except ValueError:
+        return None
+
+
+def parse_russian_date(date_str: str, reference: datetime = None):
     """Парсит дату из строки формата '8 декабря'."""
     if not date_str:
         return None
-    date_str = str(date_str).lower().strip()
-    patterns = [
-        r'(\d{1,2})\s+(\w+)\s+(\w+)', r'(\d{1,2})\s+(\w+)', r'"(\d{1,2})\s+(\w+)\s+(\w+)"'
+    day_month = _parse_day_month(str(date_str))
+    if not day_month:
+        return None
+    return _resolve_year(*day_month, reference or datetime.now(TZ))
+
+
+def decode_date_column(schedule_data: list, reference: datetime = None) -> list:
+    """
+    Декодирует столбец 'День' целиком: для каждой строки дата или None.
+    Каждая уникальная строка разбирается один раз, год считается от одной
+    опорной даты; ячейки-даты Excel (datetime) берутся как есть.
+    """
+    reference = reference or datetime.now(TZ)
+    decoded, memo = [], {}
+    for row in schedule_data:
+        cell = row[0] if row else ""
+        if not cell:
+            decoded.append(None)
+            continue
+        if isinstance(cell, datetime):
+            decoded.append(datetime(cell.year, cell.month, cell.day))
+            continue
+        key = str(cell)
+        if key not in memo:
+            memo[key] = parse_russian_date(key, reference)
+        decoded.append(memo[key])
+    return decoded
+
+
+def parse_schedule_content(content: bytes, is_xlsx: bool) -> list:
+    """Разбирает содержимое XLS/XLSX файла в список строк."""
+    data = []
+    
+    if is_xlsx:
+        wb = openpyxl.load_workbook(io.BytesIO(content))
+        sheet = wb.active
+        for row in sheet.iter_rows(values_only=True):
+            data.append([cell if cell is not None else "" for cell in row])
+    else:
+        wb = xlrd.open_workbook(file_contents=content)
+        sheet = wb.sheet_by_index(0)
+        for r in range(sheet.nrows):
+            row = [sheet.cell_value(r, c) or "" for c in range(sheet.ncols)]
+            # Числовые ячейки-даты Excel переводим в datetime, чтобы не терять дату
+            if row and row[0] and sheet.cell_type(r, 0) == xlrd.XL_CELL_DATE:
+                row[0] = xlrd.xldate_as_datetime(row[0], wb.datemode)
+            data.append(row)
+    return data
+
+
+def compile_schedule(content: bytes, is_xlsx: bool, url: str):
+    """
+    Разбирает файл и сразу строит модель: (Schedule, записи преподавателей).
+    Выполняется в пуле, поэтому функция уровня модуля и без доступа к кэшам.
+    """
+    schedule = build_schedule(parse_schedule_content(content, is_xlsx))
+    return schedule, build_teacher_postings(schedule)
+
+
+def _get_parse_executor():
+    """Возвращает пул для разбора файлов (процессы или потоки, см. PARSE_EXECUTOR)."""
+    global _parse_executor
+    if _parse_executor is None:
+        if PARSE_EXECUTOR == "thread":
+            _parse_executor = ThreadPoolExecutor(max_workers=PARSE_WORKERS)
+        else:
+            # fork из процесса с потоками (пул to_thread, драйверы) может унести в дочерний
+            # процесс захваченную блокировку; forkserver/spawn стартуют рабочих с чистого листа
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _parse_executor = ProcessPoolExecutor(
+                max_workers=PARSE_WORKERS, mp_context=multiprocessing.get_context(method)
+            )
+    return _parse_executor
+
+
+def shutdown_parse_executor():
+    """Останавливает пул разбора при завершении бота"""
+    global _parse_executor
+    if _parse_executor is not None:
+        _parse_executor.shutdown(wait=False, cancel_futures=True)
+        _parse_executor = None
+
+
+async def _parse_xls(url: str, content: bytes):
+    """Разбирает скачанный XLS/XLSX файл в пуле: (данные, индекс, записи преподавателей)."""
+    loop = asyncio.get_running_loop()
+    is_xlsx = ".xlsx" in url.lower() or content[:4] == b"PK\x03\x04"  # xlsx — это zip-архив
+    for attempt in range(2):
+        executor = _get_parse_executor()
+        try:
+            return await loop.run_in_executor(executor, compile_schedule, content, is_xlsx, url)
+        except BrokenProcessPool as e:
+            # Процесс пула убит (например, OOM) — пул больше не работает, пересоздаем его
+            print(f"❌ Пул разбора сломан при парсинге {url}: {e}")
+            if _parse_executor is executor:
+                shutdown_parse_executor()
+        except Exception as e:
+            print(f"❌ Исключение при парсинге {url}: {e}")
+            return None
+    return None
+
+
+def _is_header_row(row) -> bool:
+    """Строка заголовка таблицы: 'День' | 'Часы' | группы..."""
+    return len(row) > 2 and "день" in str(row[0]).lower() and "часы" in str(row[1]).lower()
+
+
+def _split_subject(cell) -> list:
+    """Разбивает ячейку с парой на строки без маркеров '-'."""
+    return [sys.intern(line.strip().lstrip('-').strip()) for line in str(cell).split('\n') if line.strip()]
+
+
+def build_schedule(schedule_data: list) -> Schedule:
+    """
+    Компилирует сырые строки файла в Schedule: дата -> слот группы -> пары.
+    Строится один раз при загрузке файла, дальше поиск — обычные обращения к dict.
+    Столбец группы берется из строки заголовка, первая ячейка даты открывает день.
+    """
+    group_columns = {}
+    for row in schedule_data or ():
+        if _is_header_row(row):
+            for col_idx, cell in enumerate(row):
+                name = str(cell).strip()
+                if col_idx > 1 and name and name not in group_columns:
+                    group_columns[sys.intern(name)] = col_idx
+            break
+    if not group_columns:
+        return Schedule((), {})
+
+    columns = list(group_columns.values())
+    lessons = {}  # (время, ячейка) -> Lesson, чтобы одинаковые пары хранились один раз
+    days = {}
+    day = None
+    current_date, current_time = None, None
+    for row, parsed_date in zip(schedule_data, decode_date_column(schedule_data)):
+        if parsed_date and parsed_date.date() != current_date:
+            current_date, current_time = parsed_date.date(), None
+            # Если дата в файле повторяется, выигрывает первое вхождение
+            if current_date in days:
+                day = None
+            else:
+                day = [[] for _ in columns]
+                days[current_date] = day
+        if day is None:
+            continue
+
+        time_cell = row[1] if len(row) > 1 else ""
+        if time_cell and str(time_cell).strip():
+            current_time = sys.intern(str(time_cell).strip())
+        if not current_time:
+            continue
+
+        for slot, col_idx in enumerate(columns):
+            subject_cell = row[col_idx] if len(row) > col_idx else ""
+            if subject_cell and str(subject_cell).strip():
+                cell = str(subject_cell)
+                lesson = lessons.get((current_time, cell))
+                if lesson is None:
+                    lesson = Lesson(current_time, tuple(_split_subject(cell)))
+                    lessons[(current_time, cell)] = lesson
+                day[slot].append(lesson)
+
+    return Schedule(
+        tuple(group_columns),
+        {search_date: tuple(tuple(slot) for slot in slots) for search_date, slots in days.items()}
+    )
+
+
+def _get_url_meta() -> dict:
+    """Строит обратную карту url -> (четная ли неделя, факультет, курс)."""
+    meta = {}
+    for week_type, faculties in SCHEDULE_URLS.items():
+        is_even_week = (week_type == "Четная неделя")
+        for faculty, courses in faculties.items():
+            for course, urls in courses.items():
+                for url in ([urls] if isinstance(urls, str) else urls):
+                    meta.setdefault(url, (is_even_week, faculty, course))
+    return meta
+
+URL_META = _get_url_meta()
+
+
+def build_teacher_postings(schedule: Schedule) -> tuple:
+    """Записи для поиска преподавателя: все пары файла как (дата, группа, Lesson)."""
+    return tuple(schedule.iter_lessons())
+
+
+# Преподаватель в строке пары: «Фамилия Имя Отчество, Должность» или «Фамилия И.О.»
+_TEACHER_NAME = re.compile(
+    r'([А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?)\s+([А-ЯЁ])(?:[а-яё]+\s+|\.\s*)([А-ЯЁ])(?:[а-яё]+|\.)?\s*(?:,|$)'
+)
+
+
+def teacher_key(name: str) -> str:
+    """
+    Нормализует имя к ключу индекса «фамилия и о»: 'Кудрявцев Иван Олегович',
+    'Кудрявцев И.О.' -> 'кудрявцев и о'; неполный запрос 'Кудр' -> 'кудр'.
+    """
+    words = re.findall(r'\w+(?:-\w+)?', name.lower().replace("ё", "е"))
+    if not words:
+        return ""
+    return " ".join([words[0]] + [word[0] for word in words[1:3]])
+
+
+def extract_teachers(lesson: Lesson) -> set:
+    """Ключи преподавателей, указанных в паре (у вакансий и пустых ячеек — нет)."""
+    return {
+        teacher_key(" ".join(match.groups()))
+        for line in lesson.lines for match in _TEACHER_NAME.finditer(line)
+    }
+
+
+def _drop_teacher_index(url: str):
+    """Убирает записи одного файла из TEACHER_INDEX."""
+    global _teacher_keys_sorted
+    for key in TEACHER_INDEX_KEYS.pop(url, ()):
+        by_url = TEACHER_INDEX.get(key)
+        if by_url is not None:
+            by_url.pop(url, None)
+            if not by_url:
+                del TEACHER_INDEX[key]
+                _teacher_keys_sorted = None
+
+
+def update_teacher_index(url: str, postings) -> dict:
+    """
+    Пересобирает записи одного файла в TEACHER_INDEX, не трогая остальные.
+    Возвращает записи файла по ключам — те же списки, что лежат в индексе.
+    """
+    global _teacher_keys_sorted
+    _drop_teacher_index(url)
+    by_key, lesson_keys = {}, {}
+    for posting in postings:
+        lesson = posting[2]
+        if id(lesson) not in lesson_keys:
+            lesson_keys[id(lesson)] = extract_teachers(lesson)
+        for key in lesson_keys[id(lesson)]:
+            by_key.setdefault(key, []).append(posting)
+    for key, key_postings in by_key.items():
+        TEACHER_INDEX.setdefault(key, {})[url] = key_postings
+    TEACHER_INDEX_KEYS[url] = set(by_key)
+    _teacher_keys_sorted = None
+    return by_key
+
+
+@register_collector
+def _collect_teacher_index_metrics():
+    """Размер индекса преподавателей (его объем уже входит в cache_bytes расписаний)"""
+    return [
+        ("schedule_teacher_index_keys", "gauge", "Преподавателей в индексе", (), {(): len(TEACHER_INDEX)}),
+        ("schedule_teacher_index_files", "gauge", "Файлов в индексе преподавателей", (), {(): len(TEACHER_INDEX_KEYS)}),
     ]
-    for pattern in patterns:
-        match = re.search(pattern, date_str)
-        if match:
-            groups = match.groups()
-            if len(groups) >= 2:
-                try:
-                    day = int(groups[0])
-                    month_str = groups[1].strip()
-                    month = next((num for rus_month, num in RUS_MONTHS_REVERSE.items() if rus_month in month_str), None)
-                    if month:
-                        now = datetime.now(TZ)
-                        year = now.year
-                        if month < now.month or (month == now.month and day < now.day):
-                            year += 1
-                        return datetime(year, month, day)
-                except (ValueError, IndexError):
+
+
+def _teacher_query(teacher_name: str):
+    """
+    Разбирает запрос: (префикс ключа, текст запроса, нужна ли проверка текста).
+    'Кудрявцев И.О.' полностью задан ключом, а 'Кудрявцев Иван' — только до инициала,
+    поэтому во втором случае дальше проверяется `запрос in текст пары`.
+    """
+    query = teacher_name.lower().replace("ё", "е")
+    check_text = any(len(word) > 1 for word in re.findall(r'\w+', query)[1:])
+    return teacher_key(teacher_name), query, check_text
+
+
+def _matches_text(query: str, check_text: bool, lesson: Lesson) -> bool:
+    return not check_text or query in lesson.text().lower().replace("ё", "е")
+
+
+def find_teacher_postings(teacher_name: str, target_date: datetime) -> list:
+    """
+    Ищет записи преподавателя на дату по TEACHER_INDEX: [(url, дата, группа, Lesson)].
+    Кандидаты — ключи, начинающиеся с нормализованного запроса ('кудр', 'кудрявцев и о').
+    """
+    global _teacher_keys_sorted
+    prefix, query, check_text = _teacher_query(teacher_name)
+    if not prefix:
+        return []
+    if _teacher_keys_sorted is None:
+        _teacher_keys_sorted = sorted(TEACHER_INDEX)
+    search_date = target_date.date()
+
+    found, seen = [], set()
+    for i in range(bisect_left(_teacher_keys_sorted, prefix), len(_teacher_keys_sorted)):
+        key = _teacher_keys_sorted[i]
+        if not key.startswith(prefix):
+            break
+        for url, postings in TEACHER_INDEX[key].items():
+            for posting in postings:
+                if id(posting) in seen or posting[0] != search_date:
                     continue
-    return None
+                seen.add(id(posting))
+                if _matches_text(query, check_text, posting[2]):
+                    found.append((url,) + posting)
+    return found
+
+
+def scan_teacher_postings(teacher_name: str, target_date: datetime, url: str, postings) -> list:
+    """То же, что find_teacher_postings, но по записям одного файла вне индекса."""
+    prefix, query, check_text = _teacher_query(teacher_name)
+    if not prefix:
+        return []
+    search_date = target_date.date()
+    return [
+        (url,) + posting for posting in postings
+        if posting[0] == search_date
+        and any(key.startswith(prefix) for key in extract_teachers(posting[2]))
+        and _matches_text(query, check_text, posting[2])
+    ]
 
 
-async def _load_and_parse_xls(url: str):
-    """Скачивает и парсит XLS/XLSX файл."""
+async def _get_cache_entry(url: str):
+    """
+    Возвращает Schedule из кэша или загружает файл заново.
+    Устаревшая запись отдается сразу, а обновление запускается в фоне
+    (stale-while-revalidate): ждать сеть приходится только при пустом кэше.
+    """
+    entry = SCHEDULE_CACHE.get(url)
+    if entry is not None:
+        cached_time, cached_schedule, _ = entry
+        if time.time() - cached_time >= CACHE_DURATION_SECONDS:
+            refresh_schedule(url)
+        return cached_schedule
+    
+    # shield: отмена одного ожидающего не прерывает загрузку для остальных
+    return await asyncio.shield(refresh_schedule(url))
+
+
+def refresh_schedule(url: str) -> asyncio.Future:
+    """
+    Запускает перезагрузку файла и возвращает задачу.
+    Если файл уже качается по чужому запросу — возвращает ту же загрузку.
+    """
+    return _start_refresh(url, False)
+
+
+def revalidate_schedule(url: str) -> asyncio.Future:
+    """
+    Перепроверяет вытесненный из кэша файл (для фонового обновления индексов).
+    Неизмененный файл в кэш не возвращается; измененный разбирается заново.
+    """
+    return _start_refresh(url, True)
+
+
+def _start_refresh(url: str, revalidate_only: bool) -> asyncio.Future:
+    key = ("revalidate", url) if revalidate_only else url
+    task = _INFLIGHT_LOADS.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_refresh_cache_entry(url, revalidate_only))
+        _INFLIGHT_LOADS[key] = task
+        task.add_done_callback(lambda _: _INFLIGHT_LOADS.pop(key, None))
+    return task
+
+
+async def _fetch_file(url: str, validators: dict):
+    """Скачивает файл (условно, если есть валидаторы); None при ошибке."""
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as response:
-                if response.status != 200:
-                    print(f"❌ Ошибка загрузки {url}: статус {response.status}")
-                    return None
-                
-                content = await response.read()
-                data = []
-                
-                if ".xlsx" in url.lower():
-                    wb = openpyxl.load_workbook(io.BytesIO(content))
-                    sheet = wb.active
-                    for row in sheet.iter_rows(values_only=True):
-                        data.append([cell if cell is not None else "" for cell in row])
-                else:
-                    wb = xlrd.open_workbook(file_contents=content)
-                    sheet = wb.sheet_by_index(0)
-                    for r in range(sheet.nrows):
-                        data.append([sheet.cell_value(r, c) or "" for c in range(sheet.ncols)])
-                return data
+        with observe_time(SCHEDULE_FETCH_SECONDS, url), span("fetch", url=url):
+            return await fetch_schedule_file(url, validators.get("etag"), validators.get("last_modified"))
     except Exception as e:
-        print(f"❌ Исключение при загрузке и парсинге {url}: {e}")
+        print(f"❌ Исключение при загрузке {url}: {e}")
         return None
 
 
-async def get_schedule_data_from_url(url: str):
-    """Получает данные расписания из URL, используя кэш."""
+def _install_schedule(url: str, fetched_at: float, schedule: Schedule, postings):
+    """
+    Кладет файл в кэш вместе с его записями в TEACHER_INDEX: запись кэша
+    держит те же списки, что и индекс, поэтому размер записи учитывает их.
+    """
+    cached = SCHEDULE_CACHE.peek(url)
+    if cached is not None and cached[1] is schedule:
+        SCHEDULE_CACHE[url] = (fetched_at, schedule, cached[2])  # Продление той же версии
+    else:
+        SCHEDULE_CACHE[url] = (fetched_at, schedule, update_teacher_index(url, postings))
+
+
+async def _load_stored_entry(url: str, content_hash: str):
+    """(Schedule, записи преподавателей) с диска, если версия совпадает с content_hash."""
+    stored = await asyncio.to_thread(load_schedule_entry, url)
+    if stored is None or stored[2].get("hash") != content_hash:
+        return None
+    return stored[3]
+
+
+async def _refresh_cache_entry(url: str, revalidate_only: bool = False):
+    """
+    Загружает файл, строит индексы и кладет результат в кэш.
+    Для уже виденного файла (даже вытесненного из кэша) отправляется условный
+    запрос: при 304 или совпадении хэша содержимого разбор пропускается —
+    запись продлевается, а вытесненная поднимается с диска.
+    """
     current_time = time.time()
+    cached = SCHEDULE_CACHE.peek(url)
+    validators = SCHEDULE_VALIDATORS.get(url, {})
+    
+    response = await _fetch_file(url, validators)
+    if response is None:
+        return cached[1] if cached else None
     
-    if url in SCHEDULE_CACHE:
-        cached_time, cached_data = SCHEDULE_CACHE[url]
-        if current_time - cached_time < CACHE_DURATION_SECONDS:
-            return cached_data
+    content_hash = hashlib.sha256(response["content"]).hexdigest() if response["content"] else None
     
-    new_data = await _load_and_parse_xls(url)
+    if validators and (response["status"] == 304 or content_hash == validators.get("hash")):
+        # Файл не изменился — индексы остаются прежними
+        validators.update(etag=response["etag"], last_modified=response["last_modified"])
+        SCHEDULE_CHECKED_AT[url] = current_time
+        compiled = cached[1:] if cached else None
+        if compiled is None and not revalidate_only:
+            compiled = await _load_stored_entry(url, validators.get("hash"))
+        if compiled is not None or revalidate_only:
+            if compiled is not None:
+                _install_schedule(url, current_time, *compiled)
+            await asyncio.to_thread(save_schedule_entry, url, current_time, validators)
+            return compiled[0] if compiled else None
+        if response["content"] is None:
+            # 304, но разобранной версии нет ни в памяти, ни на диске — качаем целиком
+            response = await _fetch_file(url, {})
+            if response is None:
+                return None
+            content_hash = hashlib.sha256(response["content"]).hexdigest() if response["content"] else None
     
-    if new_data:
-        SCHEDULE_CACHE[url] = (current_time, new_data)
+    compiled = None
+    if response["content"]:
+        with observe_time(SCHEDULE_PARSE_SECONDS, url), span("parse", url=url):
+            compiled = await _parse_xls(url, response["content"])
     
-    return new_data
+    if compiled and compiled[0]:
+        schedule, postings = compiled
+        _install_schedule(url, current_time, schedule, postings)
+        RENDERED_SCHEDULES.pop(url, None)
+        if validators and content_hash != validators.get("hash"):
+            SCHEDULE_CHANGED.set()
+        SCHEDULE_VALIDATORS[url] = {
+            "etag": response["etag"],
+            "last_modified": response["last_modified"],
+            "hash": content_hash
+        }
+        SCHEDULE_CHECKED_AT[url] = current_time
+        update_schedule_catalog(url, schedule)
+        await asyncio.to_thread(save_schedule_entry, url, current_time, SCHEDULE_VALIDATORS[url], compiled)
+        return schedule
+    
+    return cached[1] if cached else None
+
+
+async def restore_schedule_cache():
+    """
+    Загружает сохраненные на диске расписания в кэш при старте.
+    Записи сохраняют исходное время загрузки, поэтому устаревшие будут
+    отдаваться сразу и перепроверяться в фоне.
+    """
+    entries = await asyncio.to_thread(load_schedule_entries)
+    for url, fetched_at, validators, (schedule, postings) in entries:
+        if url not in URL_META or url in SCHEDULE_CACHE:
+            continue
+        _install_schedule(url, fetched_at, schedule, postings)
+        RENDERED_SCHEDULES.pop(url, None)
+        SCHEDULE_VALIDATORS[url] = validators
+        SCHEDULE_CHECKED_AT[url] = fetched_at
+        update_schedule_catalog(url, schedule)
+    if entries:
+        print(f"💾 Загружено расписаний с диска: {len(SCHEDULE_CACHE)}")
+
+
+async def get_schedule_data_from_url(url: str):
+    """Получает расписание (Schedule) из URL, используя кэш."""
+    return await _get_cache_entry(url)
+
+
+async def fetch_schedules(urls) -> dict:
+    """
+    Параллельно получает расписания для набора URL: url -> Schedule или None.
+    Ограничения параллельности и таймауты — в schedule_fetcher.
+    """
+    urls = list(dict.fromkeys(urls))
+    entries = await asyncio.gather(*(_get_cache_entry(url) for url in urls))
+    return dict(zip(urls, entries))
+
+
+def update_schedule_catalog(url: str, schedule: Schedule):
+    """Запоминает, какие группы и даты есть в файле."""
+    SCHEDULE_CATALOG[url] = (
+        [group for group in schedule.groups if "день" not in group.lower() and "часы" not in group.lower()],
+        frozenset(schedule.group_slots),
+        frozenset(schedule.days),
+    )
+
+
+def get_catalog_sources(faculty: str, course: int):
+    """
+    Файлы факультета и курса в порядке поиска: [(url, is_even)].
+    None, если по части файлов каталога еще нет (тогда ищем по самим файлам).
+    """
+    sources = [(url, is_even) for is_even in [False, True] for url in get_schedule_urls(faculty, course, is_even)]
+    if all(url in SCHEDULE_CATALOG for url, _ in sources):
+        return sources
+    return None
+
+
+def find_schedule_source(faculty: str, course: int, group: str, search_date):
+    """
+    Файл, в котором есть пары группы на дату: (url, is_even).
+    None — ни в одном файле нет; False — каталог неполный.
+    """
+    sources = get_catalog_sources(faculty, course)
+    if sources is None:
+        return False
+    for url, is_even in sources:
+        _, groups, dates = SCHEDULE_CATALOG[url]
+        if group in groups and search_date in dates:
+            return url, is_even
+    return None
 
 
 def get_schedule_urls(faculty: str, course: int, is_even: bool) -> list:
@@ -117,66 +639,50 @@ def get_schedule_urls(faculty: str, course: int, is_even: bool) -> list:
 
 async def get_available_groups(faculty: str, course: int) -> list:
     """Получает список доступных групп, используя кэшированные данные."""
-    for is_even in [False, True]:
-        urls = get_schedule_urls(faculty, course, is_even)
+    # По каталогу — без скачивания файлов
+    sources = get_catalog_sources(faculty, course)
+    if sources is not None:
+        for url, _ in sources:
+            if SCHEDULE_CATALOG[url][0]:
+                return list(SCHEDULE_CATALOG[url][0])
+        return []
+    
+    urls_by_week = [get_schedule_urls(faculty, course, is_even) for is_even in [False, True]]
+    entries = await fetch_schedules(url for urls in urls_by_week for url in urls)
+    
+    for urls in urls_by_week:
         for url in urls:
-            schedule_data = await get_schedule_data_from_url(url)
-            if not schedule_data: continue
+            schedule = entries[url]
+            if not schedule: continue
             
-            for row in schedule_data:
-                if len(row) > 2 and "день" in str(row[0]).lower() and "часы" in str(row[1]).lower():
-                    groups = [
-                        str(cell).strip() for cell in row[2:] 
-                        if str(cell).strip() and "день" not in str(cell).lower() and "часы" not in str(cell).lower()
-                    ]
-                    if groups: return groups
+            groups = [group for group in schedule.groups if "день" not in group.lower() and "часы" not in group.lower()]
+            if groups: return groups
     return []
 
 
-def find_group_column(schedule_data: list, group_name: str) -> int:
-    """Находит индекс столбца для группы."""
-    if not schedule_data: return -1
-    for row in schedule_data:
-        if len(row) > 2 and "день" in str(row[0]).lower() and "часы" in str(row[1]).lower():
-            for col_idx, cell in enumerate(row):
-                if str(cell).strip() == group_name:
-                    return col_idx
-            break
-    return -1
-
-
-def find_schedule_for_date(schedule_data: list, group_column: int, target_date: datetime):
-    """Ищет расписание на конкретную дату в данных файла."""
-    if not schedule_data or group_column < 0: return None
-    
+async def _render_day_schedule(url: str, is_even: bool, group: str, target_date: datetime):
+    """Текст расписания группы на дату из одного файла или None, если там его нет."""
+    # Вся группа смотрит один и тот же день — рендерим его один раз на версию файла
+    # (в том числе пустой день «пар нет») и отдаем без обращения к кэшу файлов
     search_date = target_date.date()
+    text = RENDERED_SCHEDULES.get(url, {}).get((group, search_date))
+    if text is not None:
+        if time.time() - SCHEDULE_CHECKED_AT.get(url, 0) >= CACHE_DURATION_SECONDS:
+            refresh_schedule(url)  # Перепроверка файла в фоне, как в _get_cache_entry
+        return text
     
-    for i, row in enumerate(schedule_data):
-        if not row or not row[0]: continue
-        
-        parsed_date = parse_russian_date(str(row[0]))
-        if parsed_date and parsed_date.date() == search_date:
-            lessons = []
-            current_time = None
-            for j in range(i, len(schedule_data)):
-                current_row = schedule_data[j]
-                
-                if j > i and current_row and current_row[0]:
-                    next_date = parse_russian_date(str(current_row[0]))
-                    if next_date and next_date.date() != search_date: break
-                
-                time_cell = current_row[1] if len(current_row) > 1 else ""
-                if time_cell and str(time_cell).strip():
-                    current_time = str(time_cell).strip()
-                
-                subject_cell = current_row[group_column] if len(current_row) > group_column else ""
-                if current_time and subject_cell and str(subject_cell).strip():
-                    subject_lines = [line.strip().lstrip('-').strip() for line in str(subject_cell).split('\n') if line.strip()]
-                    if subject_lines:
-                        lessons.append((current_time, subject_lines))
-            return lessons
-            
-    return None
+    schedule = await get_schedule_data_from_url(url)
+    if not schedule:
+        return None
+    
+    rendered = RENDERED_SCHEDULES.setdefault(url, {})
+    lessons = schedule.lessons_for(search_date, group)
+    if lessons is None:
+        return None
+    with span("render", group=group):
+        text = format_schedule(lessons, is_even, target_date, group)
+    rendered[(group, search_date)] = text
+    return text
 
 
 async def get_day_schedule(faculty: str, course: int, group: str, command: str):
@@ -192,29 +698,25 @@ async def get_day_schedule(faculty: str, course: int, group: str, command: str):
         if shift < 0: shift += 7
         target_date = now + timedelta(days=shift)
     
-    found_lessons, found_week_is_even = None, None
+    search_date = target_date.date()
     
-    for is_even in [False, True]:
-        urls = get_schedule_urls(faculty, course, is_even)
-        for url in urls:
-            schedule_data = await get_schedule_data_from_url(url)
-            if not schedule_data: continue
-            
-            group_column = find_group_column(schedule_data, group)
-            if group_column == -1: continue
-            
-            lessons = find_schedule_for_date(schedule_data, group_column, target_date)
-            
-            if lessons is not None:
-                found_lessons, found_week_is_even = lessons, is_even
-                break
-        if found_lessons is not None: break
+    # Каталог сразу говорит, какой файл открыть
+    source = find_schedule_source(faculty, course, group, search_date)
+    if source:
+        text = await _render_day_schedule(source[0], source[1], group, target_date)
+        if text is not None:
+            return text
     
-    if found_lessons is not None:
-        return format_schedule(found_lessons, found_week_is_even, target_date, group)
-    else:
-        is_target_week_even = (target_date.isocalendar()[1] % 2 == 0)
-        return format_schedule([], is_target_week_even, target_date, group)
+    if source is not None:
+        # Каталог неполный или устарел — перебираем файлы по порядку
+        for is_even in [False, True]:
+            for url in get_schedule_urls(faculty, course, is_even):
+                text = await _render_day_schedule(url, is_even, group, target_date)
+                if text is not None:
+                    return text
+    
+    is_target_week_even = (target_date.isocalendar()[1] % 2 == 0)
+    return format_schedule([], is_target_week_even, target_date, group)
 
 
 def format_schedule(lessons, is_even, date, group):
@@ -229,8 +731,8 @@ def format_schedule(lessons, is_even, date, group):
     if not lessons:
         result.append("🎉 *Пар нет, можно отдыхать\\!*")
     else:
-        unique_lessons = []
-        [unique_lessons.append(x) for x in lessons if x not in unique_lessons]
+        # Убираем повторы за один проход, сохраняя порядок
+        unique_lessons = list({(time, tuple(lines)): (time, lines) for time, lines in lessons}.values())
         
         def time_key(lesson):
             try: return tuple(map(int, lesson[0].split('-')[0].strip().split(':')))
@@ -246,56 +748,40 @@ def format_schedule(lessons, is_even, date, group):
 
 # ===== ФУНКЦИИ ДЛЯ ПОИСКА ПРЕПОДАВАТЕЛЯ (ИСПРАВЛЕНЫ) =====
 
+async def _find_in_evicted(teacher_name: str, target_date: datetime, url: str) -> list:
+    """Поиск преподавателя в вытесненном файле: записи читаются с диска и в кэш не попадают."""
+    validators = SCHEDULE_VALIDATORS.get(url)
+    if validators is None:
+        return []  # Файл так и не загрузился
+    compiled = await _load_stored_entry(url, validators.get("hash"))
+    if compiled is None:
+        # Копии на диске нет (SCHEDULE_STORE_PATH пуст) — остается загрузить файл в кэш
+        await get_schedule_data_from_url(url)
+        return [posting for posting in find_teacher_postings(teacher_name, target_date) if posting[0] == url]
+    return scan_teacher_postings(teacher_name, target_date, url, compiled[1])
+
+
 async def get_teacher_schedule(teacher_name: str, target_date: datetime):
     """Ищет расписание преподавателя по всем файлам на указанную дату."""
-    all_findings = []
-    
-    for week_type, faculties in SCHEDULE_URLS.items():
-        is_even_week = (week_type == "Четная неделя")
-        for faculty, courses in faculties.items():
-            for course, urls in courses.items():
-                url_list = [urls] if isinstance(urls, str) else urls
-                for url in url_list:
-                    schedule_data = await get_schedule_data_from_url(url)
-                    if not schedule_data: continue
-                    
-                    groups = {}
-                    for i, row in enumerate(schedule_data):
-                        if len(row) > 2 and "день" in str(row[0]).lower() and "часы" in str(row[1]).lower():
-                            for col, cell in enumerate(row):
-                                if col > 1 and str(cell).strip():
-                                    groups[col] = str(cell).strip()
-                            break
-                    
-                    if not groups: continue
-
-                    for i, row in enumerate(schedule_data):
-                        parsed_date = parse_russian_date(str(row[0]))
-                        if parsed_date and parsed_date.date() == target_date.date():
-                            current_time = None
-                            for j in range(i, len(schedule_data)):
-                                current_row = schedule_data[j]
-                                if j > i and current_row and current_row[0]:
-                                    next_date = parse_russian_date(str(current_row[0]))
-                                    if next_date and next_date.date() != target_date.date(): break
-                                
-                                time_cell = current_row[1] if len(current_row) > 1 else ""
-                                if time_cell and str(time_cell).strip():
-                                    current_time = str(time_cell).strip()
-
-                                for col, group_name in groups.items():
-                                    if col < len(current_row) and teacher_name.lower() in str(current_row[col]).lower():
-                                        subject_lines = [line.strip().lstrip('-').strip() for line in str(current_row[col]).split('\n') if line.strip()]
-                                        if current_time and subject_lines:
-                                            all_findings.append({
-                                                "time": current_time,
-                                                "group": group_name,
-                                                "details": tuple(subject_lines),  # Преобразуем в tuple для хэширования
-                                                "is_even": is_even_week
-                                            })
+    # Ни разу не загруженные файлы качаем параллельно, вытесненные в кэш не возвращаем
+    await fetch_schedules(url for url in URL_META if url not in SCHEDULE_CACHE and url not in SCHEDULE_VALIDATORS)
+    postings = find_teacher_postings(teacher_name, target_date)
+    for url in [url for url in URL_META if url not in TEACHER_INDEX_KEYS]:
+        postings.extend(await _find_in_evicted(teacher_name, target_date, url))
+
+    all_findings = [
+        {
+            "time": lesson.time,
+            "group": group,
+            "details": lesson.lines,
+            "is_even": URL_META[url][0]
+        }
+        for url, _, group, lesson in postings
+    ]
 
     return format_teacher_schedule(teacher_name, target_date, all_findings)
 
+
 def format_teacher_schedule(teacher_name, date, findings):
     """Форматирует найденное расписание преподавателя."""
     date_str = f"{RUS_DAYS_SHORT[date.weekday()]} {date.day} {RUS_MONTHS[date.month]}"
@@ -0,0 +1,58 @@
+import asyncio
+import random
+import time
+
+from config import PREFETCH_CHECK_SECONDS, PREFETCH_MARGIN_SECONDS, PREFETCH_JITTER_SECONDS
+from schedule_parser import (
+    SCHEDULE_CACHE, SCHEDULE_VALIDATORS, SCHEDULE_CHECKED_AT, CACHE_DURATION_SECONDS, URL_META,
+    refresh_schedule, revalidate_schedule
+)
+
+
+def get_due_urls(now: float) -> list:
+    """
+    URL, которые скоро устареют (в кэше или вытесненные), и еще ни разу не загруженные.
+    Незагруженные догружаем, только пока кэш не упирается в бюджет памяти,
+    иначе прогрев будет бесконечно вытеснять сам себя.
+    """
+    refresh_age = CACHE_DURATION_SECONDS - PREFETCH_MARGIN_SECONDS
+    load_missing = not SCHEDULE_CACHE.is_full()
+    return [
+        url for url in URL_META
+        if (url in SCHEDULE_CACHE and now - SCHEDULE_CACHE[url][0] >= refresh_age)
+        or (url not in SCHEDULE_CACHE and url in SCHEDULE_VALIDATORS
+            and now - SCHEDULE_CHECKED_AT.get(url, 0) >= refresh_age)
+        or (url not in SCHEDULE_CACHE and url not in SCHEDULE_VALIDATORS and load_missing)
+    ]
+
+
+async def _prefetch(url: str, delay: float):
+    """Обновляет один файл после задержки (разброс, чтобы не качать все разом)."""
+    if delay > 0:
+        await asyncio.sleep(delay)
+    if url not in SCHEDULE_CACHE and url in SCHEDULE_VALIDATORS:
+        await revalidate_schedule(url)  # Вытесненный: только проверяем, в кэш не возвращаем
+    else:
+        await refresh_schedule(url)
+
+
+async def run_schedule_prefetcher():
+    """
+    Фоновая задача: заранее перекачивает все файлы из SCHEDULE_URLS,
+    чтобы запросы пользователей всегда обслуживались из кэша.
+    """
+    print("🔄 Фоновое обновление расписаний запущено")
+    while True:
+        try:
+            due = get_due_urls(time.time())
+            if due:
+                # Отсутствующие файлы качаем сразу, обновления растягиваем во времени
+                await asyncio.gather(*(
+                    _prefetch(url, random.uniform(0, PREFETCH_JITTER_SECONDS) if url in SCHEDULE_VALIDATORS else 0)
+                    for url in due
+                ))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Ошибка фонового обновления расписаний: {e}")
+        await asyncio.sleep(PREFETCH_CHECK_SECONDS)
@@ -0,0 +1,97 @@
+import asyncio
+import os
+import re
+
+from config import SCHEDULE_URLS, SCHEDULE_SOURCE, SCHEDULE_LOCAL_DIR
+from schedule_fetcher import fetch_url
+
+
+def find_local_schedule_file(week: str, faculty: str, course: int):
+    """
+    Ищет файл в зеркале: <SCHEDULE_LOCAL_DIR>/<неделя>/<факультет>/<...> N курс <...>.xls.
+    Файлы 'расписание групп-часов' пропускаются; файл без номера курса
+    считается единственным курсом факультета (например, 'ДиА.xls').
+    """
+    folder = os.path.join(SCHEDULE_LOCAL_DIR, week, faculty)
+    try:
+        names = sorted(
+            name for name in os.listdir(folder)
+            if name.lower().endswith((".xls", ".xlsx")) and "групп-часов" not in name.lower()
+        )
+    except OSError:
+        return None
+
+    for name in names:
+        match = re.search(r'(\d+)\s*курс', name)
+        if match and int(match.group(1)) == course:
+            return os.path.join(folder, name)
+    if len(names) == 1 and not re.search(r'\d+\s*курс', names[0]):
+        return os.path.join(folder, names[0])
+    return None
+
+
+def _get_local_files() -> dict:
+    """Строит карту url -> путь к файлу зеркала для всех URL из SCHEDULE_URLS."""
+    local_files = {}
+    for week, faculties in SCHEDULE_URLS.items():
+        for faculty, courses in faculties.items():
+            for course, urls in courses.items():
+                path = find_local_schedule_file(week, faculty, course)
+                if path:
+                    for url in ([urls] if isinstance(urls, str) else urls):
+                        local_files.setdefault(url, path)
+    return local_files
+
+LOCAL_SCHEDULE_FILES = _get_local_files()
+
+
+def _read_local_file(path: str, last_modified: str = None):
+    """Читает файл целиком; если mtime не изменился — возвращает 304 без чтения."""
+    mtime = str(os.stat(path).st_mtime_ns)
+    if mtime == last_modified:
+        return {"status": 304, "content": None, "etag": None, "last_modified": mtime}
+    with open(path, "rb") as f:
+        content = f.read()
+    if not content:
+        return None
+    return {"status": 200, "content": content, "etag": None, "last_modified": mtime}
+
+
+async def fetch_local_file(url: str, etag: str = None, last_modified: str = None):
+    """Источник 'local': отдает файл из зеркала sheets/ вместо bb.usurt.ru."""
+    path = LOCAL_SCHEDULE_FILES.get(url)
+    if path is None:
+        print(f"❌ Нет локального файла для {url}")
+        return None
+    return await asyncio.to_thread(_read_local_file, path, last_modified)
+
+
+async def fetch_auto(url: str, etag: str = None, last_modified: str = None):
+    """Источник 'auto': сначала сеть, при ошибке — локальное зеркало."""
+    try:
+        response = await fetch_url(url, etag, last_modified)
+    except Exception as e:
+        print(f"❌ Исключение при загрузке {url}: {e}")
+        response = None
+    if response is None and url in LOCAL_SCHEDULE_FILES:
+        print(f"📁 {url} недоступен, берем файл из локального зеркала")
+        # Валидаторы сети и зеркала несовместимы, поэтому зеркало читаем целиком,
+        # а его mtime не сохраняем: иначе он уйдет в сеть как If-Modified-Since.
+        # Повторный разбор после возврата сети отсекает хэш содержимого
+        response = await fetch_local_file(url)
+        if response is not None:
+            response["last_modified"] = None
+    return response
+
+
+SCHEDULE_SOURCES = {
+    "http": fetch_url,
+    "local": fetch_local_file,
+    "auto": fetch_auto,
+}
+
+
+async def fetch_schedule_file(url: str, etag: str = None, last_modified: str = None):
+    """Получает файл расписания из источника, выбранного в SCHEDULE_SOURCE."""
+    source = SCHEDULE_SOURCES.get(SCHEDULE_SOURCE, fetch_url)
+    return await source(url, etag, last_modified)
@@ -0,0 +1,96 @@
+import pickle
+import sqlite3
+
+from config import SCHEDULE_STORE_PATH
+
+# Меняем при изменении формата данных/индексов — старые записи будут проигнорированы
+STORE_VERSION = 4
+
+
+def _connect():
+    """Открывает файл хранилища и создает таблицу при необходимости."""
+    conn = sqlite3.connect(SCHEDULE_STORE_PATH)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schedules (
+            url TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            fetched_at REAL NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            content_hash TEXT,
+            payload BLOB NOT NULL
+        )
+    ''')
+    return conn
+
+
+def save_schedule_entry(url: str, fetched_at: float, validators: dict, compiled=None):
+    """
+    Сохраняет разобранный файл (Schedule, записи преподавателей) на диск.
+    Без compiled обновляет только время и валидаторы (файл не изменился).
+    Синхронная функция — вызывать через asyncio.to_thread.
+    """
+    if not SCHEDULE_STORE_PATH:
+        return
+    try:
+        conn = _connect()
+        with conn:
+            if compiled is None:
+                conn.execute(
+                    'UPDATE schedules SET fetched_at = ?, etag = ?, last_modified = ? WHERE url = ?',
+                    (fetched_at, validators.get("etag"), validators.get("last_modified"), url)
+                )
+            else:
+                conn.execute(
+                    'INSERT OR REPLACE INTO schedules VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (url, STORE_VERSION, fetched_at, validators.get("etag"),
+                     validators.get("last_modified"), validators.get("hash"),
+                     pickle.dumps(compiled, protocol=pickle.HIGHEST_PROTOCOL))
+                )
+        conn.close()
+    except Exception as e:
+        print(f"❌ Ошибка сохранения расписания {url} на диск: {e}")
+
+
+def _decode_rows(rows) -> list:
+    """Распаковывает строки таблицы в [(url, fetched_at, validators, compiled)]."""
+    entries = []
+    for url, fetched_at, etag, last_modified, content_hash, payload in rows:
+        try:
+            compiled = pickle.loads(payload)
+        except Exception as e:
+            print(f"❌ Поврежденная запись расписания {url}: {e}")
+            continue
+        validators = {"etag": etag, "last_modified": last_modified, "hash": content_hash}
+        entries.append((url, fetched_at, validators, compiled))
+    return entries
+
+
+def _select(where: str, params: tuple) -> list:
+    if not SCHEDULE_STORE_PATH:
+        return []
+    try:
+        conn = _connect()
+        rows = conn.execute(
+            'SELECT url, fetched_at, etag, last_modified, content_hash, payload '
+            'FROM schedules WHERE version = ?' + where, (STORE_VERSION,) + params
+        ).fetchall()
+        conn.close()
+    except Exception as e:
+        print(f"❌ Ошибка чтения сохраненных расписаний: {e}")
+        return []
+    return _decode_rows(rows)
+
+
+def load_schedule_entries() -> list:
+    """
+    Читает все сохраненные файлы текущей версии:
+    [(url, fetched_at, validators, (Schedule, записи преподавателей))].
+    """
+    return _select("", ())
+
+
+def load_schedule_entry(url: str):
+    """Читает один сохраненный файл: (url, fetched_at, validators, compiled) или None."""
+    entries = _select(" AND url = ?", (url,))
+    return entries[0] if entries else None
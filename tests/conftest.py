@@ -0,0 +1,10 @@
+import os
+import sys
+
+# config.py читает окружение при импорте: задаем его до импорта модулей бота
+os.environ.setdefault("BOT_TOKEN", "test")
+os.environ.setdefault("DATABASE_URL", "postgresql://test")
+os.environ["SCHEDULE_SOURCE"] = "http"
+os.environ["SCHEDULE_STORE_PATH"] = ""  # Не пишем расписания на диск
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,131 @@
+import asyncio
+
+import pytest
+
+import db_repository
+from metrics import DB_POOL_SATURATED, DB_QUERY_ERRORS, DB_CURSORS, render_metrics
+
+
+class FakeConnection:
+    """Соединение asyncpg: запоминает запросы, падает на тексте с FAIL"""
+
+    def __init__(self):
+        self.calls = []
+
+    async def execute(self, query, *args):
+        if "FAIL" in query:
+            raise RuntimeError("query failed")
+        self.calls.append(("execute", query, args))
+        return "OK"
+
+    async def fetchrow(self, query, *args):
+        self.calls.append(("fetchrow", query, args))
+        return {"faculty": "ФУПП"}
+
+    def cursor(self, query, *args, prefetch=None):
+        self.calls.append(("cursor", query, args, prefetch))
+        return iter(())
+
+
+class FakePool:
+    """Пул asyncpg из max_size соединений"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.idle = [FakeConnection() for _ in range(max_size)]
+        self.released = 0
+
+    def get_size(self):
+        return self.max_size
+
+    def get_idle_size(self):
+        return len(self.idle)
+
+    def get_min_size(self):
+        return 1
+
+    def get_max_size(self):
+        return self.max_size
+
+    async def acquire(self):
+        while not self.idle:
+            await asyncio.sleep(0.01)
+        return self.idle.pop()
+
+    async def release(self, conn):
+        self.released += 1
+        self.idle.append(conn)
+
+
+def _sample(name: str) -> float:
+    """Значение строки метрики из вывода /metrics"""
+    for line in render_metrics().splitlines():
+        if line.startswith(name + " "):
+            return float(line.rsplit(" ", 1)[1])
+    return 0
+
+
+def test_named_queries_are_timed():
+    pool = FakePool(2)
+
+    async def scenario():
+        async with db_repository.acquire(pool) as conn:
+            row = await db_repository.fetchrow(conn, "get_user", 42)
+        return conn, row
+
+    before = _sample('db_query_duration_seconds_count{query="get_user"}')
+    conn, row = asyncio.run(scenario())
+    assert row == {"faculty": "ФУПП"}
+    assert conn.calls == [("fetchrow", db_repository.QUERIES["get_user"], (42,))]
+    assert pool.released == 1
+    assert _sample('db_query_duration_seconds_count{query="get_user"}') == before + 1
+
+
+def test_query_errors_are_counted(monkeypatch):
+    monkeypatch.setitem(db_repository.QUERIES, "broken", "SELECT FAIL")
+    pool = FakePool(1)
+
+    async def scenario():
+        async with db_repository.acquire(pool) as conn:
+            await db_repository.execute(conn, "broken")
+
+    before = DB_QUERY_ERRORS.value("broken")
+    with pytest.raises(RuntimeError):
+        asyncio.run(scenario())
+    assert DB_QUERY_ERRORS.value("broken") == before + 1
+    assert pool.released == 1  # Соединение вернулось в пул и после ошибки
+
+
+def test_saturation_is_counted():
+    pool = FakePool(1)
+
+    async def hold(seconds):
+        async with db_repository.acquire(pool) as conn:
+            await asyncio.sleep(seconds)
+            await db_repository.execute(conn, "delete_users", [1])
+
+    async def scenario():
+        first = asyncio.create_task(hold(0.05))
+        await asyncio.sleep(0)  # Первый забрал единственное соединение
+        await hold(0)
+        await first
+
+    before = DB_POOL_SATURATED.value()
+    asyncio.run(scenario())
+    assert DB_POOL_SATURATED.value() == before + 1
+    assert pool.released == 2
+
+
+def test_cursor_is_counted():
+    conn = FakeConnection()
+    before = DB_CURSORS.value("recent_users")
+    db_repository.cursor(conn, "recent_users", 10, prefetch=5)
+    assert conn.calls == [("cursor", db_repository.QUERIES["recent_users"], (10,), 5)]
+    assert DB_CURSORS.value("recent_users") == before + 1
+
+
+def test_pool_stats():
+    pool = FakePool(3)
+    pool.idle.pop()
+    assert db_repository.get_pool_stats(pool) == {"size": 3, "idle": 2, "in_use": 1, "min_size": 1, "max_size": 3}
+    assert db_repository.get_pool_stats(None) == {}
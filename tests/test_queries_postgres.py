@@ -0,0 +1,130 @@
+"""
+Именованные запросы db_repository на настоящем Postgres.
+Запускаются, только если задан TEST_DATABASE_URL; каждый тест работает
+во временной схеме и удаляет ее за собой.
+"""
+import asyncio
+import json
+import os
+import uuid
+
+import asyncpg
+import pytest
+
+import config
+from db_repository import QUERIES, acquire, cursor, execute, executemany, fetch, fetchrow
+
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+pytestmark = pytest.mark.skipif(not TEST_DATABASE_URL, reason="TEST_DATABASE_URL не задан")
+
+CHECKED = set()  # Запросы, которые прогнал хотя бы один тест
+
+
+def run_in_schema(scenario):
+    """Создает схему и пул с search_path на нее, создает таблицы и выполняет scenario(pool)"""
+    async def main():
+        schema = f"test_{uuid.uuid4().hex[:12]}"
+        admin = await asyncpg.connect(TEST_DATABASE_URL)
+        await admin.execute(f"CREATE SCHEMA {schema}")
+        pool = await asyncpg.create_pool(
+            TEST_DATABASE_URL, min_size=1, max_size=2, statement_cache_size=0,
+            server_settings={"search_path": schema}
+        )
+        previous, config.db_pool = config.db_pool, pool
+        try:
+            await config.create_tables()
+            CHECKED.update(("create_users_table", "add_daily_push_column", "create_fsm_table", "create_fsm_updated_index"))
+            async with acquire(pool) as conn:
+                tables = {row["tablename"] for row in await conn.fetch(
+                    "SELECT tablename FROM pg_tables WHERE schemaname = $1", schema
+                )}
+                assert tables == {"users", "fsm_states"}
+                await scenario(conn)
+        finally:
+            config.db_pool = previous
+            await pool.close()
+            await admin.execute(f"DROP SCHEMA {schema} CASCADE")
+            await admin.close()
+    asyncio.run(main())
+
+
+def _user(user_id, faculty="ФУПП", course="1", group="УПП-111"):
+    return (user_id, faculty, course, group, f"user{user_id}", f"Студент {user_id}")
+
+
+def test_user_queries():
+    async def scenario(conn):
+        await executemany(conn, "upsert_user", [_user(1), _user(2, group="УПП-112"), _user(3, course="2")])
+        await executemany(conn, "upsert_user", [_user(1, group="УПП-113")])  # Повторная регистрация
+        row = await fetchrow(conn, "get_user", 1)
+        assert (row["faculty"], row["course"], row["group_name"]) == ("ФУПП", "1", "УПП-113")
+
+        async with conn.transaction():
+            recent = [row["user_id"] async for row in cursor(conn, "recent_users", 10, prefetch=2)]
+        assert sorted(recent) == [1, 2, 3]
+
+        assert await execute(conn, "delete_users", [2, 3, 404]) == "DELETE 2"
+        assert await fetchrow(conn, "get_user", 2) is None
+        CHECKED.update(("upsert_user", "get_user", "recent_users", "delete_users"))
+
+    run_in_schema(scenario)
+
+
+def test_daily_push_queries():
+    async def scenario(conn):
+        users = [_user(i, group=f"УПП-11{i % 3}") for i in range(1, 8)]
+        await executemany(conn, "upsert_user", users)
+        for user_id in range(1, 7):
+            assert (await fetchrow(conn, "toggle_daily_push", user_id))["daily_push"] is True
+        assert (await fetchrow(conn, "toggle_daily_push", 6))["daily_push"] is False
+
+        # Постраничный обход по ключу (факультет, курс, группа, user_id) страницами по 2
+        after, pages = ("", "", "", 0), []
+        while True:
+            page = await fetch(conn, "daily_push_recipients", *after, 2)
+            if not page:
+                break
+            pages.append([row["user_id"] for row in page])
+            last = page[-1]
+            after = (last["faculty"], last["course"], last["group_name"], last["user_id"])
+        expected = sorted(
+            (user for user in users if user[0] <= 5), key=lambda user: (user[1], user[2], user[3], user[0])
+        )
+        assert [user_id for page in pages for user_id in page] == [user[0] for user in expected]
+        assert all(len(page) <= 2 for page in pages)
+
+        await execute(conn, "disable_daily_push", [1, 2])
+        rest = await fetch(conn, "daily_push_recipients", "", "", "", 0, 100)
+        assert sorted(row["user_id"] for row in rest) == [3, 4, 5]
+        CHECKED.update(("toggle_daily_push", "daily_push_recipients", "disable_daily_push"))
+
+    run_in_schema(scenario)
+
+
+def test_fsm_queries():
+    async def scenario(conn):
+        data = {"faculty": "ФУПП", "course": 1, "nested": {"a": [1, 2]}}
+        await execute(conn, "fsm_set_state", "k1", "Registration:choosing_group")
+        await execute(conn, "fsm_set_data", "k1", json.dumps(data, ensure_ascii=False))
+        await execute(conn, "fsm_set_data", "k2", json.dumps({"x": 1}))
+        await execute(conn, "fsm_set_state", "k3", None)  # Пустая запись после state.clear()
+
+        row = await fetchrow(conn, "fsm_get", "k1")
+        assert row["state"] == "Registration:choosing_group"
+        assert json.loads(row["data"]) == data
+        row = await fetchrow(conn, "fsm_get", "k2")
+        assert row["state"] is None and json.loads(row["data"]) == {"x": 1}
+
+        # Брошенный сценарий: updated_at в прошлом
+        await conn.execute("UPDATE fsm_states SET updated_at = CURRENT_TIMESTAMP - interval '2 hours' WHERE key = 'k2'")
+        assert await execute(conn, "fsm_delete_expired", 3600.0) == "DELETE 2"  # k2 устарел, k3 пустой
+        assert await fetchrow(conn, "fsm_get", "k1") is not None
+        assert await fetchrow(conn, "fsm_get", "k3") is None
+        CHECKED.update(("fsm_set_state", "fsm_set_data", "fsm_get", "fsm_delete_expired"))
+
+    run_in_schema(scenario)
+
+
+def test_every_query_is_checked():
+    """Новый запрос в QUERIES должен получить проверку здесь"""
+    assert CHECKED == set(QUERIES)
@@ -0,0 +1,109 @@
+import asyncio
+import glob
+import os
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+import schedule_fetcher
+import schedule_parser
+
+SHEETS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sheets")
+SHEET = sorted(
+    path for path in glob.glob(os.path.join(SHEETS_DIR, "**", "*.xls"), recursive=True)
+    if "групп-часов" not in path
+)[0]
+
+
+@pytest.fixture(autouse=True)
+def fresh_fetcher():
+    """Семафоры привязываются к циклу событий, а в каждом тесте цикл свой"""
+    schedule_fetcher._GLOBAL_LIMIT = asyncio.Semaphore(schedule_fetcher.FETCH_CONCURRENCY)
+    schedule_fetcher._HOST_LIMITS.clear()
+    yield
+    schedule_parser.shutdown_parse_executor()
+
+
+async def _serve(handler):
+    """Сервер на localhost, отдающий любой путь через handler"""
+    app = web.Application()
+    app.router.add_get("/{name:.*}", handler)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+async def _close(server):
+    await schedule_fetcher.close_http_session()
+    await server.close()
+
+
+def test_concurrent_misses_download_once():
+    with open(SHEET, "rb") as f:
+        content = f.read()
+    hits = []
+
+    async def handler(request):
+        hits.append(request.path)
+        await asyncio.sleep(0.05)  # Пока идет загрузка, остальные промахи должны ее ждать
+        return web.Response(body=content)
+
+    async def scenario():
+        server = await _serve(handler)
+        try:
+            url = str(server.make_url("/dedup.xls"))
+            results = await asyncio.gather(*(schedule_parser.get_schedule_data_from_url(url) for _ in range(10)))
+        finally:
+            await _close(server)
+        return url, results
+
+    url, results = asyncio.run(scenario())
+    assert hits == ["/dedup.xls"]
+    assert results[0] is not None and results[0].groups
+    assert all(result is results[0] for result in results)
+    assert schedule_parser.SCHEDULE_CACHE.peek(url)[1] is results[0]
+
+
+def test_per_host_limit(monkeypatch):
+    monkeypatch.setattr(schedule_fetcher, "FETCH_PER_HOST_LIMIT", 2)
+    active, peak = 0, 0
+
+    async def handler(request):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.05)
+        active -= 1
+        return web.Response(body=b"x")
+
+    async def scenario():
+        server = await _serve(handler)
+        try:
+            return await asyncio.gather(*(
+                schedule_fetcher.fetch_url(str(server.make_url(f"/{i}.xls"))) for i in range(8)
+            ))
+        finally:
+            await _close(server)
+
+    responses = asyncio.run(scenario())
+    assert all(response["status"] == 200 and response["content"] == b"x" for response in responses)
+    assert peak == 2
+
+
+def test_timeout(monkeypatch):
+    monkeypatch.setattr(schedule_fetcher, "FETCH_TIMEOUT_SECONDS", 0.1)
+
+    async def handler(request):
+        await asyncio.sleep(1)
+        return web.Response(body=b"late")
+
+    async def scenario():
+        server = await _serve(handler)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await schedule_fetcher.fetch_url(str(server.make_url("/slow.xls")))
+        finally:
+            await _close(server)
+
+    asyncio.run(scenario())
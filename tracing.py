@@ -0,0 +1,144 @@
+"""
+Трассировка апдейтов: дерево участков (handler, db, fetch, parse, render, telegram)
+для каждого апдейта. Медленные апдейты пишутся в лог одной JSON-строкой.
+
+    with span("render", group=group):
+        text = format_schedule(...)
+
+Вне апдейта (фоновые задачи) span() ничего не делает.
+По желанию часть апдейтов профилируется cProfile, и профиль медленных сохраняется.
+"""
+import cProfile
+import io
+import json
+import os
+import pstats
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from aiogram import BaseMiddleware
+
+# Участок, внутри которого сейчас выполняется код (свой у каждой задачи asyncio)
+_current_span = ContextVar("current_span", default=None)
+
+# cProfile может быть включен только один за раз
+_profiler_busy = False
+
+
+class Span:
+    """Участок трассы: имя, атрибуты, длительность и вложенные участки"""
+    __slots__ = ("name", "attrs", "start", "duration", "children")
+
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.duration = None
+        self.children = []
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.start
+
+    def to_dict(self, root_start: float) -> dict:
+        result = {
+            "name": self.name,
+            "offset_ms": round((self.start - root_start) * 1000, 2),
+            # Незавершенный участок (например, общая загрузка, которую еще ждут другие)
+            "duration_ms": round(self.duration * 1000, 2) if self.duration is not None else None,
+        }
+        if self.attrs:
+            result["attrs"] = self.attrs
+        if self.children:
+            result["children"] = [child.to_dict(root_start) for child in self.children]
+        return result
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Отмечает участок кода в трассе текущего апдейта"""
+    parent = _current_span.get()
+    if parent is None:
+        yield
+        return
+    child = Span(name, attrs)
+    parent.children.append(child)
+    token = _current_span.set(child)
+    try:
+        yield
+    finally:
+        child.finish()
+        _current_span.reset(token)
+
+
+def _start_profiler(sample_rate: float):
+    """Включает cProfile для выборки апдейтов, если он свободен"""
+    global _profiler_busy
+    if _profiler_busy or not sample_rate or random.random() >= sample_rate:
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None  # Уже работает другой профилировщик
+    _profiler_busy = True
+    return profiler
+
+
+def _stop_profiler(profiler, update_id, save_dir: str) -> dict:
+    """Выключает профилировщик; для медленного апдейта (save_dir задан) сохраняет профиль и топ функций"""
+    global _profiler_busy
+    profiler.disable()
+    _profiler_busy = False
+    if not save_dir:
+        return None
+    os.makedirs(save_dir, exist_ok=True)
+    path = os.path.join(save_dir, f"update-{update_id}-{int(time.time())}.prof")
+    profiler.dump_stats(path)
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+    return {"path": path, "top": out.getvalue().strip().splitlines()[-16:]}
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на dp.update: открывает корневой участок апдейта и,
+    если апдейт шел дольше slow_seconds, печатает его дерево в JSON.
+    С вероятностью profile_sample_rate апдейт профилируется cProfile; в профиль
+    попадают и чужие задачи цикла — это профиль нагрузки, а не одного апдейта.
+    """
+
+    def __init__(self, slow_seconds: float, profile_sample_rate: float = 0, profile_dir: str = "profiles"):
+        self.slow_seconds = slow_seconds
+        self.profile_sample_rate = profile_sample_rate
+        self.profile_dir = profile_dir
+
+    async def __call__(self, handler, event, data):
+        user = data.get("event_from_user")
+        root = Span("update", {"update_id": event.update_id, "type": event.event_type})
+        token = _current_span.set(root)
+        profiler = _start_profiler(self.profile_sample_rate)
+        error = None
+        try:
+            return await handler(event, data)
+        except Exception as e:
+            error = repr(e)
+            raise
+        finally:
+            root.finish()
+            _current_span.reset(token)
+            slow = root.duration >= self.slow_seconds
+            profile = _stop_profiler(profiler, event.update_id, slow and self.profile_dir) if profiler else None
+            if slow:
+                record = {
+                    "event": "slow_update",
+                    "update_id": event.update_id,
+                    "user_id": user.id if user else None,
+                    "duration_ms": round(root.duration * 1000, 2),
+                    "error": error,
+                    "trace": root.to_dict(root.start),
+                }
+                if profile:
+                    record["profile"] = profile
+                print(json.dumps(record, ensure_ascii=False))
@@ -0,0 +1,73 @@
+import time
+from collections import OrderedDict
+
+
+class UserCache:
+    """
+    LRU-кэш пользователей user_id -> данные с ограничением по количеству
+    и необязательным TTL (0 — записи не устаревают).
+    get() — обращение пользователя (статистика + LRU).
+    """
+
+    def __init__(self, capacity: int, ttl_seconds: float = 0):
+        self.capacity = capacity
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()  # user_id -> (время записи, данные)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return bool(self.ttl_seconds) and time.monotonic() - stored_at > self.ttl_seconds
+
+    def __contains__(self, user_id):
+        item = self._entries.get(user_id)
+        return item is not None and not self._is_expired(item[0])
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, user_id):
+        item = self._entries.get(user_id)
+        if item is None or self._is_expired(item[0]):
+            if item is not None:
+                del self._entries[user_id]
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(user_id)
+        return item[1]
+
+    def __getitem__(self, user_id):
+        return self._entries[user_id][1]
+
+    def __setitem__(self, user_id, data):
+        self._entries[user_id] = (time.monotonic(), data)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def __delitem__(self, user_id):
+        del self._entries[user_id]
+
+    def preload(self, user_id, data) -> bool:
+        """
+        Добавляет запись при прогреве в «старый» конец LRU, не вытесняя
+        уже использованные. Возвращает False, когда место закончилось.
+        """
+        if len(self._entries) >= self.capacity:
+            return False
+        if user_id not in self._entries:
+            self._entries[user_id] = (time.monotonic(), data)
+            self._entries.move_to_end(user_id, last=False)
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,83 @@
+import asyncio
+import secrets
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from config import WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_IN_FLIGHT, WEBHOOK_DRAIN_SECONDS
+
+
+class WebhookHandler:
+    """
+    Принимает обновления от Telegram на общем aiohttp-сервере.
+    Запрос подтверждается сразу, обработка идет в фоне; одновременно
+    обрабатывается не больше max_in_flight обновлений — при перегрузке
+    ответ задерживается, и Telegram сам притормаживает отправку.
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, secret: str, max_in_flight: int):
+        self.dp = dp
+        self.bot = bot
+        self.secret = secret
+        self.slots = asyncio.Semaphore(max_in_flight)
+        self.tasks = set()
+        self.draining = False
+
+    async def handle(self, request: web.Request) -> web.Response:
+        token = request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+        if not secrets.compare_digest(token, self.secret):
+            return web.Response(status=401)
+        if self.draining:
+            return web.Response(status=503)  # Telegram повторит доставку позже
+
+        update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        await self.slots.acquire()
+        task = asyncio.create_task(self._process(update))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return web.Response()
+
+    async def _process(self, update: Update):
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception as e:
+            print(f"❌ Ошибка обработки обновления {update.update_id}: {e}")
+        finally:
+            self.slots.release()
+
+    async def drain(self, timeout: float):
+        """Перестает принимать обновления и ждет уже начатые"""
+        self.draining = True
+        if self.tasks:
+            print(f"⏳ Дожидаемся обработки обновлений: {len(self.tasks)}")
+            await asyncio.wait(self.tasks, timeout=timeout)
+
+
+def setup_webhook(dp: Dispatcher, bot: Bot, app: web.Application) -> WebhookHandler:
+    """Подключает диспетчер к aiohttp-приложению (до запуска сервера)"""
+    handler = WebhookHandler(dp, bot, WEBHOOK_SECRET, WEBHOOK_MAX_IN_FLIGHT)
+    app.router.add_post(WEBHOOK_PATH, handler.handle)
+    return handler
+
+
+async def run_webhook(handler: WebhookHandler, stop: asyncio.Event):
+    """
+    Регистрирует вебхук в Telegram и работает до сигнала остановки (stop),
+    затем дожидается начатых обновлений. Вебхук при остановке не снимается: при перезапуске
+    на Render новый экземпляр уже мог поставить свой.
+    """
+    dp, bot = handler.dp, handler.bot
+    await bot.set_webhook(
+        WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=handler.secret,
+        max_connections=min(100, WEBHOOK_MAX_IN_FLIGHT),
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    print(f"🪝 Вебхук установлен: {WEBHOOK_BASE_URL.rstrip('/')}{WEBHOOK_PATH}")
+    try:
+        await stop.wait()
+        print("🛑 Получен сигнал остановки")
+    finally:
+        await handler.drain(WEBHOOK_DRAIN_SECONDS)
+        await bot.session.close()